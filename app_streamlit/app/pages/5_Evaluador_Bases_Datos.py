@@ -14,11 +14,18 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+import hashlib
+import importlib.util
+import heapq
+import io
 import json
+import math
+import re
 import time
-from scipy.ndimage import uniform_filter1d  # Para suavizado de tendencias
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 from pathlib import Path
+from typing import NamedTuple, Optional
 # Agregar directorio raíz al path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
@@ -30,33 +37,890 @@ from config.settings import settings, ETHICAL_WARNING_PII
 # Importar geopy si está disponible (opcional)
 try:
     from geopy.geocoders import Nominatim
-    from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+    from geopy.exc import GeocoderServiceError
+    from geopy.adapters import RequestsAdapter
+    from geopy.extra.rate_limiter import RateLimiter
     GEOPY_AVAILABLE = True
 except ImportError:
     GEOPY_AVAILABLE = False
 
+# Detector de formato de fecha de pandas (público desde pandas 2.2)
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:
+    guess_datetime_format = None
+
+# pyarrow es opcional (lector CSV multihilo): basta saber si está instalado
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Esquema conocido del dataset simulado (evita inferencia de tipos al leer).
+# Enteros en int32 como mínimo, igual que optimize_dtypes: sin desbordes en sumas y restas
+SIMULATED_DTYPES = {
+    'hora': str,
+    'edad': 'int32',
+    'año': 'int32',
+    'mes': 'int32',
+    'latitud': 'float64',
+    'longitud': 'float64',
+}
+SIMULATED_DATE_COLS = ['fecha', 'fecha_completa']
+
+# Ubicaciones posibles del dataset simulado (relativas al directorio de ejecución)
+SIMULATED_CSV_PATHS = (
+    '../../data/datos_simulados_valencia_suicidios_1980_2025.csv',  # TU UBICACIÓN: Desde app/pages/ → data/ en raíz ✅
+    '../data/datos_simulados_valencia_suicidios_1980_2025.csv',  # Desde app/ → data/
+    'data/datos_simulados_valencia_suicidios_1980_2025.csv',  # Si ejecutas desde raíz del proyecto
+    'app/data/datos_simulados_valencia_suicidios_1980_2025.csv',  # Estructura alternativa
+    'datos_simulados_valencia_suicidios_1980_2025.csv',  # Mismo directorio (fallback)
+    '/mnt/user-data/outputs/datos_simulados_valencia_suicidios_1980_2025.csv'  # Desarrollo/testing
+)
+
+# Ciudades comunes para estimar la región de las direcciones
+CIUDADES_SPAIN = ('valencia', 'madrid', 'barcelona', 'sevilla', 'zaragoza', 'málaga',
+                  'murcia', 'palma', 'bilbao', 'alicante', 'córdoba', 'valladolid')
+CIUDADES_LATAM = ('santiago', 'valparaíso', 'concepción', 'valdivia', 'temuco',
+                  'puerto montt', 'buenos aires', 'lima', 'bogotá', 'caracas', 'quito',
+                  'ciudad de méxico', 'guadalajara', 'monterrey', 'medellín')
+# Una sola alternancia compilada: el texto se recorre una vez para todas las ciudades
+_CITY_RE = re.compile(r"\b(" + "|".join(map(re.escape, CIUDADES_SPAIN + CIUDADES_LATAM)) + r")\b")
+_CITY_TO_REGION = {**dict.fromkeys(CIUDADES_SPAIN, "España"), **dict.fromkeys(CIUDADES_LATAM, "Latinoamérica")}
+
+# Catálogo de modelos predictivos recomendables (se filtra según el dataset)
+PRIORIDAD_ALTA = '🔴 Alta'
+PRIORIDAD_MEDIA = '🟠 Media'
+PRIORIDAD_BAJA = '🟡 Baja'
+
+
+class ModeloRecomendado(NamedTuple):
+    tipo: str
+    modelos: str
+    caso_de_uso: str
+    prioridad: str
+
+
+MODEL_CATALOG_COLUMNS = ['Tipo', 'Modelos', 'Caso de Uso', 'Prioridad']
+MODEL_CATALOG = (
+    ModeloRecomendado('Clasificación', 'Regresión Logística, Random Forest, XGBoost',
+                      'Predecir categorías (ej: riesgo alto/bajo, tipo de evento)', PRIORIDAD_ALTA),
+    ModeloRecomendado('Regresión', 'Regresión Lineal, Random Forest Regressor, Gradient Boosting',
+                      'Predecir valores continuos (ej: tasa, score, cantidad)', PRIORIDAD_ALTA),
+    ModeloRecomendado('Series Temporales', 'ARIMA, Prophet, LSTM',
+                      'Predecir tendencias futuras basadas en histórico', PRIORIDAD_ALTA),
+    ModeloRecomendado('Clustering', 'K-Means, DBSCAN, Hierarchical',
+                      'Identificar grupos naturales en los datos', PRIORIDAD_BAJA),
+    ModeloRecomendado('Detección de Anomalías', 'Isolation Forest, One-Class SVM, Autoencoders',
+                      'Identificar casos atípicos o eventos inusuales', PRIORIDAD_MEDIA),
+)
+
+# Por encima de este número de puntos el mapa se agrega en celdas (~100 m) en el servidor
+MAP_POINTS_LIMIT = 50_000
+MAP_CELL_DECIMALS = 3
+
+# Palabras clave (regex) para detectar columnas por nombre
+ADDRESS_COL_PATTERN = r"direc|address|ubicac|location|lugar|domicilio|calle|street"
+DATE_COL_PATTERN = r"fecha|date|tiempo|time|cuando|when"
+COMUNA_COL_PATTERN = r"comuna|ciudad|municipio|localidad|territorio"
+LOCATION_KEYWORDS = ('ubicacion', 'barrio', 'direccion', 'localidad', 'zona',
+                     'location', 'address', 'place', 'city', 'municipality')
+
 
 # ==================== FUNCIÓN HELPER PARA JSON ====================
-def convert_numpy_types(obj):
-    """Convierte tipos numpy a tipos Python nativos para serialización JSON"""
-    if isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    elif isinstance(obj, (np.bool_, bool)):
+def _clean_array(arr: np.ndarray) -> list:
+    """Convierte un ndarray a lista nativa, con NaN/Inf → None en una pasada vectorizada"""
+    if arr.dtype.kind != 'f':
+        return arr.tolist()
+    finite = np.isfinite(arr)
+    if finite.all():
+        return arr.tolist()
+    cleaned = arr.astype(object)
+    cleaned[~finite] = None
+    return cleaned.tolist()
+
+
+def _native_scalar(obj):
+    """Convierte un valor hoja (no dict/list) a un tipo Python nativo"""
+    if isinstance(obj, (np.bool_, bool)):
         return bool(obj)
-    elif isinstance(obj, (np.integer, int)):
+    if isinstance(obj, (np.integer, int)):
         return int(obj)
-    elif isinstance(obj, (np.floating, float)):
-        if np.isnan(obj) or np.isinf(obj):
-            return None
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif pd.isna(obj):
+    if isinstance(obj, (np.floating, float)):
+        value = float(obj)
+        return value if math.isfinite(value) else None
+    if isinstance(obj, np.ndarray):
+        return _clean_array(obj)
+    if obj is None or obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, (np.datetime64, np.timedelta64)) and np.isnat(obj):
+        return None
+    return obj
+
+
+def convert_numpy_types(obj):
+    """
+    Convierte tipos numpy a tipos Python nativos para serialización JSON.
+    
+    Recorre la estructura con una pila explícita (sin recursión), preservando
+    el orden de claves de los diccionarios.
+    """
+    root = [None]
+    stack = [(root, 0, obj)]
+    while stack:
+        parent, key, value = stack.pop()
+        value_type = type(value)
+        if value_type is dict or isinstance(value, dict):
+            converted = dict.fromkeys(value)
+            for child_key, child in value.items():
+                stack.append((converted, child_key, child))
+        elif value_type is list or isinstance(value, list):
+            converted = [None] * len(value)
+            for index, child in enumerate(value):
+                stack.append((converted, index, child))
+        else:
+            converted = _native_scalar(value)
+        parent[key] = converted
+    return root[0]
+
+
+# ==================== CARGA Y ANÁLISIS (CACHEADOS) ====================
+@st.cache_resource(show_spinner=False)
+def find_simulated_csv() -> Optional[str]:
+    """Primera ruta existente de SIMULATED_CSV_PATHS (compartida entre reruns y sesiones)"""
+    return next((path for path in SIMULATED_CSV_PATHS if Path(path).exists()), None)
+
+
+def dataframe_fingerprint(df: pd.DataFrame) -> str:
+    """Huella estable del contenido de un DataFrame para usar como clave de caché"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((df.shape, tuple(str(c) for c in df.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+# Enteros que caben en int32 con margen para sumas y diferencias sin desbordar
+INT32_SAFE_LIMIT = 2**30
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduce el tamaño en memoria de las columnas int64 pasándolas a int32
+    cuando sus valores dejan margen para la aritmética posterior.
+    
+    Los float no se tocan: float32 altera las coordenadas de origen y ese ruido
+    llega al análisis, al JSON y al diagnóstico. Las columnas de texto se
+    mantienen como object: los analizadores de tipología y ML dependen de que
+    sigan siendo de tipo string.
+    """
+    for col in df.select_dtypes(include='int64').columns:
+        values = df[col].to_numpy()
+        if len(values) and -INT32_SAFE_LIMIT < values.min() and values.max() < INT32_SAFE_LIMIT:
+            df[col] = values.astype(np.int32)
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def load_simulated_dataset(path: str) -> pd.DataFrame:
+    """Carga el CSV de datos simulados una sola vez por ruta"""
+    df = pd.read_csv(
+        path,
+        engine='pyarrow' if PYARROW_AVAILABLE else 'c',
+        dtype=SIMULATED_DTYPES,
+        parse_dates=SIMULATED_DATE_COLS
+    )
+    return optimize_dtypes(df)
+
+
+@st.cache_data(show_spinner=False)
+def load_uploaded(file_bytes: bytes, ext: str) -> pd.DataFrame:
+    """Lee un archivo subido (CSV o Excel), cacheado por contenido"""
+    buffer = io.BytesIO(file_bytes)
+    if ext == '.csv':
+        return optimize_dtypes(pd.read_csv(buffer))
+    return optimize_dtypes(pd.read_excel(buffer))
+
+
+@st.cache_data(show_spinner=False, ttl=settings.FILE_RETENTION_HOURS * 3600)
+def cached_parallel_analysis(dataset_key: str, _df: pd.DataFrame):
+    """
+    Ejecuta run_parallel_analysis una sola vez por contenido del dataset
+    (dataset_key = dataframe_fingerprint(_df), calculada por quien llama).
+    
+    Solo en memoria y con expiración FILE_RETENTION_HOURS: los resultados
+    incluyen ejemplos de PII y no deben escribirse a disco.
+    """
+    return run_parallel_analysis(_df)
+
+
+@st.cache_data(show_spinner=False)
+def results_json_bytes(dataset_key: str, _results: dict) -> bytes:
+    """JSON del análisis completo en UTF-8, serializado una sola vez por dataset"""
+    return json.dumps(convert_numpy_types(_results), indent=2, ensure_ascii=False).encode('utf-8')
+
+
+@st.cache_data(show_spinner=False)
+def quality_pdf_bytes(dataset_key: str, _results: dict) -> bytes:
+    """Reporte PDF de calidad generado una sola vez por dataset"""
+    pdf = generate_data_quality_pdf(_results)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+# Filas máximas del heatmap: con 400 px de alto, más filas no aportan resolución
+HEATMAP_MAX_ROWS = 500
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: dataframe_fingerprint})
+def cached_missing_heatmap(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Máscara de valores faltantes, recalculada solo si cambia el dataset.
+    
+    Si hay más de HEATMAP_MAX_ROWS registros, agrupa filas consecutivas en
+    bloques y devuelve la proporción de faltantes de cada bloque.
+    """
+    heatmap_data = get_missing_heatmap_data(df)
+    if heatmap_data is None:
         return None
-    else:
-        return obj
+    
+    # float32 basta para una máscara 0/1 y reduce a la mitad el payload de Plotly
+    heatmap_data = heatmap_data.astype(np.float32)
+    n_rows = len(heatmap_data)
+    if n_rows <= HEATMAP_MAX_ROWS:
+        return heatmap_data
+    
+    edges = np.linspace(0, n_rows, HEATMAP_MAX_ROWS + 1, dtype=int)
+    binned = np.add.reduceat(
+        heatmap_data.to_numpy(), edges[:-1], axis=0
+    ) / np.diff(edges).astype(np.float32)[:, None]
+    return pd.DataFrame(binned, index=heatmap_data.index[edges[:-1]], columns=heatmap_data.columns)
+
+
+def fast_corr(df: pd.DataFrame, cols: list) -> pd.DataFrame:
+    """
+    Correlación de Pearson como un único producto matricial sobre datos estandarizados.
+    
+    Con valores faltantes recurre a DataFrame.corr (correlación por pares completos).
+    """
+    X = df[cols].to_numpy(dtype=np.float32, copy=True)  # Se estandariza in situ
+    if len(X) < 2 or np.isnan(X).any():
+        return df[cols].corr().astype(np.float32)
+    X -= X.mean(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X /= X.std(axis=0, ddof=1)  # Columnas constantes → NaN, igual que pandas
+    corr = (X.T @ X) / (len(X) - 1)
+    return pd.DataFrame(corr, index=cols, columns=cols)
+
+
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: dataframe_fingerprint})
+def cached_correlation_matrix(df: pd.DataFrame, cols: tuple) -> pd.DataFrame:
+    """Matriz de correlación (float32, solo para visualización) cacheada por dataset"""
+    return fast_corr(df, list(cols))
+
+
+# ==================== HELPERS DE RESULTADOS ====================
+TYPOLOGY_COLUMNS = [
+    'inferred_type', 'unique_count', 'mixed_types', 'encoding_issues',
+    'semantic_inconsistencies', 'pattern_anomalies'
+]
+
+
+def typology_columns_frame(columns_analysis: dict) -> pd.DataFrame:
+    """
+    Aplana el análisis por columna (tipología) en un DataFrame con valores por defecto.
+    
+    Rellena arrays numpy ya tipados en una sola pasada, sin inferencia de tipos de pandas.
+    """
+    n = len(columns_analysis)
+    names = np.empty(n, dtype=object)
+    inferred = np.empty(n, dtype=object)
+    unique = np.empty(n, dtype=np.int64)
+    mixed = np.empty(n, dtype=bool)
+    encoding = np.empty(n, dtype=bool)
+    semantic = np.empty(n, dtype=object)
+    pattern = np.empty(n, dtype=object)
+    for i, (col, data) in enumerate(columns_analysis.items()):
+        names[i] = col
+        inferred[i] = data.get('inferred_type') or 'unknown'
+        unique[i] = data.get('unique_count') or 0
+        mixed[i] = bool(data.get('mixed_types', False))
+        encoding[i] = bool(data.get('encoding_issues', False))
+        semantic_issues = data.get('semantic_inconsistencies')
+        semantic[i] = semantic_issues if isinstance(semantic_issues, list) else []
+        pattern_issues = data.get('pattern_anomalies')
+        pattern[i] = pattern_issues if isinstance(pattern_issues, list) else []
+    return pd.DataFrame(
+        dict(zip(TYPOLOGY_COLUMNS, (inferred, unique, mixed, encoding, semantic, pattern))),
+        index=pd.Index(names)
+    )
+
+
+def classify_columns(df: pd.DataFrame):
+    """Clasifica las columnas en numéricas, categóricas y temporales en una sola pasada"""
+    numeric_cols, categorical_cols, datetime_cols = [], [], []
+    for col, dtype in df.dtypes.items():
+        if dtype.kind in 'iufc':
+            numeric_cols.append(col)
+        elif dtype.kind == 'M':
+            datetime_cols.append(col)
+        elif dtype == object or isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            categorical_cols.append(col)
+    return numeric_cols, categorical_cols, datetime_cols
+
+
+def completeness_stats(columns_analysis: dict, top_n: int = 5):
+    """
+    Resume el análisis de completitud por columna en una sola pasada.
+    
+    Retorna (variables completas, variables críticas >50%, top_n columnas con
+    mayor missing_rate como pares (columna, tasa)).
+    """
+    complete_vars = 0
+    critical_vars = []
+    rates = []
+    for col, data in columns_analysis.items():
+        complete_vars += data.get('missing_rate', 1) == 0
+        rate = data.get('missing_rate', 0)
+        rates.append((col, rate))
+        if rate > 0.5:
+            critical_vars.append(col)
+    top_missing = heapq.nlargest(top_n, rates, key=lambda item: item[1])
+    return complete_vars, critical_vars, top_missing
+
+
+def build_geo_frame(df: pd.DataFrame, location_col, lat_col, lon_col, date_col=None) -> pd.DataFrame:
+    """
+    Prepara el DataFrame de puntos para los mapas: ubicacion, lat, lon y, si hay
+    columna temporal (ya datetime64), fecha/año/mes. Descarta filas sin coordenadas.
+    """
+    df_geo = df[[location_col, lat_col, lon_col]]
+    
+    # Agregar columna temporal si existe (derivar año/mes sin re-parsear)
+    if date_col is not None:
+        dt = df[date_col]
+        fecha = dt
+        if dt.dt.tz is not None:
+            # Año/mes como enteros naive: evita el camino lento de groupby sobre datos con zona horaria
+            dt = dt.dt.tz_localize(None)
+        df_geo = df_geo.assign(**{
+            'fecha': fecha,
+            'año': dt.dt.year.astype('Int16'),
+            'mes': dt.dt.month.astype('Int8')
+        })
+    
+    df_geo = df_geo.dropna(subset=[lat_col, lon_col])
+    
+    # Renombrar columnas para plotly
+    df_geo = df_geo.rename(columns={lat_col: 'lat', lon_col: 'lon', location_col: 'ubicacion'})
+    
+    # Categoría: los groupby por ubicación agrupan sobre códigos enteros, no sobre strings
+    df_geo['ubicacion'] = df_geo['ubicacion'].astype('category')
+    
+    # ~1 m de precisión basta para el mapa; float32 reduce a la mitad lo enviado al navegador
+    df_geo[['lat', 'lon']] = df_geo[['lat', 'lon']].round(5).astype('float32')
+    return df_geo
+
+
+def count_unique_coords(lat: np.ndarray, lon: np.ndarray) -> int:
+    """Cuenta pares (lat, lon) distintos a 5 decimales empaquetando cada par en un uint64"""
+    lat_key = np.round(lat.astype(np.float64) * 1e5).astype(np.int32).view(np.uint32).astype(np.uint64)
+    lon_key = np.round(lon.astype(np.float64) * 1e5).astype(np.int32).view(np.uint32).astype(np.uint64)
+    return np.unique((lat_key << np.uint64(32)) | lon_key).size
+
+
+@st.cache_data(show_spinner=False)
+def year_index(dataset_key: str, geo_cols: tuple, _df_geo: pd.DataFrame) -> dict:
+    """Posiciones de fila de df_geo por año, cacheadas por dataset y columnas geo usadas"""
+    return _df_geo.groupby('año', sort=False).indices
+
+
+@st.cache_data(show_spinner=False)
+def geo_summary(dataset_key: str, geo_cols: tuple, _df_geo: pd.DataFrame) -> dict:
+    """Centro, extensión y ubicaciones únicas de df_geo en una sola lectura de lat/lon"""
+    lat = _df_geo['lat'].to_numpy()
+    lon = _df_geo['lon'].to_numpy()
+    if lat.size == 0:
+        return {'centro_lat': np.nan, 'centro_lon': np.nan, 'lat_range': np.nan,
+                'lon_range': np.nan, 'ubicaciones_unicas': 0}
+    return {
+        'centro_lat': float(lat.mean(dtype=np.float64)),
+        'centro_lon': float(lon.mean(dtype=np.float64)),
+        'lat_range': float(np.ptp(lat)),
+        'lon_range': float(np.ptp(lon)),
+        'ubicaciones_unicas': count_unique_coords(lat, lon)
+    }
+
+
+def parse_dates(series: pd.Series) -> pd.Series:
+    """
+    Convierte una columna a datetime (NaT si no se puede).
+    
+    El formato se detecta una vez en la primera fecha no nula y se pasa
+    explícito, para que pandas use su parser en C en vez de inferir por valor.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    formato = None
+    primera = series.first_valid_index()
+    if guess_datetime_format is not None and primera is not None:
+        muestra = series.loc[primera]
+        if isinstance(muestra, str):
+            formato = guess_datetime_format(muestra)
+    return pd.to_datetime(series, format=formato, errors='coerce', cache=True)
+
+
+@st.cache_data(show_spinner=False)
+def date_strings(dataset_key: str, date_col: str, n: int, _df: pd.DataFrame) -> np.ndarray:
+    """Primeras n fechas de date_col como texto 'AAAA-MM-DD'. Cacheado por dataset, columna y n."""
+    return parse_dates(_df[date_col].head(n)).dt.strftime('%Y-%m-%d').to_numpy()
+
+
+# Abreviaturas de mes (índice = mes - 1) para etiquetas de tendencia y patrones
+MES_ABBR = np.array(['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun',
+                     'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic'])
+
+# Abreviaturas de día (índice = dayofweek, lunes = 0)
+DIA_ABBR = np.array(['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom'])
+
+# Colores intensos según intensidad de los clusters animados
+ANIMATION_COLOR_MAP = {
+    'Baja': '#4A90E2',      # Azul
+    'Media': '#F5A623',     # Naranja
+    'Alta': '#FF6B6B',      # Rojo
+    'Crítica': '#FF1744'    # Rojo intenso
+}
+INTENSITY_ORDER = list(ANIMATION_COLOR_MAP)
+ANIMATION_CATEGORY_ORDERS = {'intensidad': INTENSITY_ORDER}
+
+# Por encima de estos límites (ajustables en la página) la animación bloquea
+# el navegador: se usa un mapa estático. El dataset simulado abarca 46 años.
+ANIMATION_MAX_EVENTS = 50_000
+ANIMATION_MAX_YEARS = 100
+
+
+@st.cache_data(show_spinner=False)
+def animation_aggregates(dataset_key: str, geo_cols: tuple, max_locations: int, _df_anim: pd.DataFrame):
+    """
+    Agrega df_anim en clusters (lat, lon, año, ubicacion) con su intensidad y
+    cuenta los eventos por año. Cacheado por dataset, columnas geo y límite.
+    
+    Solo se animan las `max_locations` coordenadas con más eventos; los eventos
+    por año se cuentan sobre todos los datos.
+    """
+    eventos_por_año = (
+        _df_anim['año'].value_counts(sort=False)
+        .sort_index()
+        .rename_axis('año')
+        .reset_index(name='total')
+        .astype({'total': np.int32})
+    )
+    
+    # Agrupar por año y ubicación para crear clusters heterogéneos
+    # (lat/lon como códigos enteros: el hash de enteros es más barato que el de floats)
+    lat_codes, lat_values = pd.factorize(_df_anim['lat'])
+    lon_codes, lon_values = pd.factorize(_df_anim['lon'])
+    
+    # Limitar el tamaño de cada frame a las ubicaciones más activas
+    location_codes = lat_codes.astype(np.int64) * len(lon_values) + lon_codes
+    _, location_inverse, location_counts = np.unique(location_codes, return_inverse=True, return_counts=True)
+    if len(location_counts) > max_locations:
+        top_locations = np.argpartition(location_counts, -max_locations)[-max_locations:]
+        keep = np.isin(location_inverse, top_locations)
+        _df_anim, lat_codes, lon_codes = _df_anim[keep], lat_codes[keep], lon_codes[keep]
+    
+    df_anim_year = (
+        _df_anim.assign(_lat_c=lat_codes.astype(np.int32), _lon_c=lon_codes.astype(np.int32))
+        .groupby(['_lat_c', '_lon_c', 'año', 'ubicacion'], sort=False, observed=True)
+        .size()
+        .reset_index(name='eventos')
+        .sort_values('año', kind='stable', ignore_index=True)  # Frames de la animación en orden
+        .astype({'eventos': np.int32})  # Tipos estrechos: menos bytes en el JSON hacia el navegador
+    )
+    df_anim_year.insert(0, 'lat', np.asarray(lat_values)[df_anim_year.pop('_lat_c').to_numpy()])
+    df_anim_year.insert(1, 'lon', np.asarray(lon_values)[df_anim_year.pop('_lon_c').to_numpy()])
+    
+    # Crear categorías de intensidad para heterogeneidad visual
+    # (cuartiles de max_eventos, intervalos cerrados por la derecha). Los colores los
+    # asigna plotly con color_discrete_map, así que no se guarda una columna de color por fila.
+    max_eventos = df_anim_year['eventos'].max()
+    bucket = np.digitize(
+        df_anim_year['eventos'].to_numpy(),
+        max_eventos * np.array([0.25, 0.5, 0.75]),
+        right=True
+    )
+    df_anim_year['intensidad'] = pd.Categorical.from_codes(bucket, categories=INTENSITY_ORDER, ordered=True)
+    return df_anim_year, eventos_por_año
+
+
+@st.cache_data(show_spinner=False)
+def build_animation_figure(dataset_key: str, geo_cols: tuple, max_locations: int, anim_speed: int,
+                           cluster_size_multiplier: float, _df_anim_year: pd.DataFrame) -> dict:
+    """
+    Construye la animación anual de clusters (plotly express recorre cada frame,
+    lo que cuesta segundos). Se cachea como dict por dataset y controles.
+    """
+    # Crear animación con colores heterogéneos por intensidad
+    fig_anim = px.scatter_mapbox(
+        _df_anim_year,
+        lat='lat',
+        lon='lon',
+        size='eventos',
+        color='intensidad',  # Usar intensidad categórica
+        animation_frame='año',
+        hover_name='ubicacion',
+        hover_data={
+            'lat': ':.4f',
+            'lon': ':.4f',
+            'eventos': True,
+            'intensidad': True,
+            'año': True
+        },
+        zoom=11,
+        mapbox_style="carto-darkmatter",
+        title="Evolución Anual - Clusters por Intensidad",
+        height=750,
+        color_discrete_map=ANIMATION_COLOR_MAP,  # Usar mapa de colores discreto
+        size_max=40 * cluster_size_multiplier,
+        category_orders=ANIMATION_CATEGORY_ORDERS
+    )
+    
+    # Mejorar diseño con colores para fondo oscuro
+    fig_anim.update_layout(
+        margin=dict(l=0, r=0, t=60, b=0),
+        coloraxis_colorbar=dict(
+            title=dict(
+                text="Eventos",
+                font=dict(color='white', size=14)  # Blanco para fondo oscuro
+            ),
+            thickness=18,
+            len=0.7,
+            tickfont=dict(color='white')  # Blanco para fondo oscuro
+        ),
+        font=dict(
+            size=13,
+            color='white'  # Blanco para fondo oscuro
+        ),
+        title=dict(
+            font=dict(color='white', size=16)  # Blanco para fondo oscuro
+        )
+    )
+    
+    # Configurar controles de animación
+    fig_anim.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = anim_speed
+    fig_anim.layout.updatemenus[0].buttons[0].args[1]['transition']['duration'] = anim_speed // 2
+    
+    # Mejorar slider temporal
+    fig_anim.layout.sliders[0].pad = dict(t=60, b=15)
+    fig_anim.layout.sliders[0].currentvalue = dict(
+        prefix="Año: ",
+        font=dict(size=18, color='#64FFDA', family='Inter')  # Teal para destacar
+    )
+    fig_anim.layout.sliders[0].font = dict(color='white')  # Blanco para fondo oscuro
+    
+    # Mejorar marcadores
+    fig_anim.update_traces(
+        marker=dict(
+            opacity=0.85
+        )
+    )
+    return fig_anim.to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def build_static_density_figure(dataset_key: str, geo_cols: tuple, max_locations: int,
+                                _df_anim_year: pd.DataFrame) -> dict:
+    """
+    Alternativa estática a la animación para datasets grandes: densidad de
+    todos los años acumulados, ponderada por eventos. Cacheada como dict.
+    """
+    df_total = (
+        _df_anim_year.groupby(['lat', 'lon'], sort=False)['eventos']
+        .sum()
+        .reset_index()
+    )
+    fig = px.density_mapbox(
+        df_total,
+        lat='lat',
+        lon='lon',
+        z='eventos',
+        radius=12,
+        zoom=11,
+        mapbox_style="carto-darkmatter",
+        title="Densidad acumulada de eventos (todos los años)",
+        height=750,
+        color_continuous_scale='Hot'
+    )
+    fig.update_layout(
+        margin=dict(l=0, r=0, t=60, b=0),
+        font=dict(size=13, color='white'),  # Blanco para fondo oscuro
+        title=dict(font=dict(color='white', size=16))
+    )
+    return fig.to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def temporal_frame(dataset_key: str, date_col: str, _df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fechas válidas de date_col con año, mes y día de la semana.
+    Se calcula una vez por dataset y columna (no en cada rerun).
+    """
+    # Sin copiar el subset: solo se materializa la columna de fechas ya convertida
+    fechas = parse_dates(_df[date_col].dropna()).dropna()
+    
+    # Extraer componentes temporales (solo los que se usan, en una sola construcción)
+    fecha_dt = fechas.dt
+    año = fecha_dt.year
+    mes = fecha_dt.month
+    return pd.DataFrame({
+        'fecha': fechas,
+        'año': año,
+        'mes': mes,
+        'día_semana': fecha_dt.dayofweek,
+        # Meses desde 1970-01: clave entera común a todos los niveles de agregación
+        'mes_abs': (año - 1970) * 12 + (mes - 1)
+    })
+
+
+@st.cache_data(show_spinner=False)
+def build_temporal_figure(dataset_key: str, date_col: str, agregacion: str, mostrar_tendencia: bool,
+                          titulo: str, _eventos_agg: pd.DataFrame) -> dict:
+    """
+    Construye la serie temporal epidemiológica (línea, tendencia y media).
+    Cacheada como dict por dataset, columna de fecha y controles.
+    """
+    # Arrays numpy una sola vez: Plotly los serializa sin pasar por Series
+    periodos = _eventos_agg['Período'].to_numpy()
+    eventos = _eventos_agg['Eventos'].to_numpy()
+    
+    # Crear gráfico epidemiológico profesional
+    fig_temporal = go.Figure()
+    
+    # Línea principal
+    fig_temporal.add_trace(go.Scatter(
+        x=periodos,
+        y=eventos,
+        mode='lines+markers',
+        name='Eventos',
+        line=dict(color='#2E86AB', width=2),
+        marker=dict(size=6, color='#2E86AB'),
+        hovertemplate='<b>%{x|%Y-%m}</b><br>Eventos: %{y}<extra></extra>'
+    ))
+    
+    # Línea de tendencia (suavizado)
+    if mostrar_tendencia and len(eventos) > 3:
+        window = min(12 if agregacion == "Mensual" else 4, len(eventos) // 3)
+        if window >= 2:
+            # Media móvil centrada con sumas acumuladas (bordes reflejados,
+            # igual que uniform_filter1d pero sin depender de scipy)
+            left = window // 2
+            padded = np.pad(eventos.astype(np.float64),
+                            (left, window - 1 - left), mode='symmetric')
+            acumulado = np.concatenate(([0.0], np.cumsum(padded)))
+            tendencia = ((acumulado[window:] - acumulado[:-window]) / window).astype(np.float32)
+            fig_temporal.add_trace(go.Scatter(
+                x=periodos,
+                y=tendencia,
+                mode='lines',
+                name='Tendencia',
+                line=dict(color='#A23B72', width=3, dash='dash'),
+                hovertemplate='<b>Tendencia</b><br>%{y:.1f}<extra></extra>'
+            ))
+    
+    # Media histórica
+    media = eventos.mean()
+    fig_temporal.add_hline(
+        y=media,
+        line_dash="dot",
+        line_color="gray",
+        annotation_text=f"Media: {media:.1f}",
+        annotation_position="right"
+    )
+    
+    # Configuración del layout
+    fig_temporal.update_layout(
+        title={
+            'text': f'<b>{titulo}</b>',
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': {'size': 18}
+        },
+        xaxis_title='Período',
+        yaxis_title='Número de Eventos',
+        hovermode='x unified',
+        height=450,
+        template='plotly_white',
+        showlegend=True,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    
+    return fig_temporal.to_dict()
+
+
+@st.cache_data(show_spinner=False)
+def semantic_payload(dataset_key: str, _semantic: dict):
+    """
+    Extrae del análisis semántico las métricas y listas de issues a mostrar.
+    
+    Se cachea por huella del dataset (`dataset_key`): el resultado semántico es
+    determinista para un mismo dataset, por lo que no se vuelve a recorrer.
+    """
+    summary = _semantic.get('summary', {})
+    return (
+        summary.get('score', 100),
+        summary.get('total_issues', 0),
+        summary.get('critical_issues', 0),
+        summary.get('quality_level', 'excelente'),
+        list(_semantic.get('edad_invalida', [])),
+        list(_semantic.get('fechas_incoherentes', [])),
+        list(_semantic.get('metodos_no_estandarizados', [])),
+        list(_semantic.get('valores_imposibles', []))
+    )
+
+
+# ==================== GEOCODIFICACIÓN ====================
+# Nominatim admite como máximo 1 petición/segundo; los hilos solo solapan latencia de red
+GEOCODE_WORKERS = 4
+GEOCODE_MIN_DELAY = 1.0
+GEOCODE_TIMEOUT = 3
+
+@st.cache_resource(show_spinner=False)
+def geocode_rng() -> np.random.Generator:
+    """
+    Generador único para la variación de las coordenadas aproximadas.
+    
+    Se conserva entre reruns (no se vuelve a sembrar en cada ejecución), así
+    que la variación no repite la misma secuencia en cada análisis.
+    """
+    return np.random.default_rng()
+
+# Diccionario de coordenadas de comunas de Chile (Región de Los Ríos y alrededores)
+COMUNAS_CHILE = {
+    # Región de Los Ríos
+    'valdivia': (-39.8142, -73.2459),
+    'la union': (-40.2934, -73.0836),
+    'rio bueno': (-40.3342, -72.9562),
+    'lago ranco': (-40.3167, -72.5000),
+    'futrono': (-40.1333, -72.3833),
+    'panguipulli': (-39.6431, -72.3328),
+    'lanco': (-39.4489, -72.7694),
+    'los lagos': (-39.8569, -72.8169),
+    'mariquina': (-39.5333, -72.9667),
+    'corral': (-39.8889, -73.4308),
+    'mafil': (-39.6667, -72.9500),
+    'paillaco': (-40.0708, -72.8778),
+    # Región de Los Lagos
+    'osorno': (-40.5742, -73.1317),
+    'puerto montt': (-41.4693, -72.9424),
+    'puerto varas': (-41.3194, -72.9836),
+    'castro': (-42.4792, -73.7619),
+    'ancud': (-41.8706, -73.8261),
+    # Otras
+    'temuco': (-38.7359, -72.5904),
+    'concepcion': (-36.8270, -73.0497),
+    'santiago': (-33.4489, -70.6693),
+}
+
+# Nombres alternativos de comunas (ya normalizados) → clave en COMUNAS_CHILE
+COMUNA_ALIASES = {
+    'san jose de la mariquina': 'mariquina',
+}
+
+
+def normalize_comunas(comunas: pd.Series) -> pd.Series:
+    """Minúsculas, sin tildes y con alias resueltos (vectorizado), para buscar en COMUNAS_CHILE"""
+    normalized = (
+        comunas.str.lower()
+        .str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('ascii')
+    )
+    return normalized.replace(COMUNA_ALIASES)
+
+
+@st.cache_resource(show_spinner=False)
+def build_geocoder(user_agent: str = "cuidar_ia_evaluator"):
+    """
+    Crea una función geocode de Nominatim segura para usar desde varios hilos.
+    
+    Se crea una sola vez por proceso (cache_resource): la sesión HTTP y sus
+    conexiones keep-alive se reutilizan entre ejecuciones, y el RateLimiter
+    respeta la política de uso de Nominatim. Los errores de servicio se
+    propagan (GeocoderServiceError) para distinguirlos de "sin resultados".
+    """
+    geolocator = Nominatim(
+        user_agent=user_agent,
+        timeout=GEOCODE_TIMEOUT,
+        adapter_factory=lambda proxies, ssl_context: RequestsAdapter(
+            proxies=proxies,
+            ssl_context=ssl_context,
+            pool_connections=GEOCODE_WORKERS,
+            pool_maxsize=GEOCODE_WORKERS
+        )
+    )
+    return RateLimiter(
+        geolocator.geocode,
+        min_delay_seconds=GEOCODE_MIN_DELAY,
+        max_retries=0,
+        swallow_exceptions=False
+    )
+
+
+def geocode_cache_key(address, comuna) -> str:
+    """Clave de caché sin la dirección en claro (las direcciones son datos personales)"""
+    return hashlib.blake2b(f"{address}_{comuna}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_geocode_cache() -> dict:
+    """
+    Carga la caché de geocodificación persistida en disco (JSON).
+    
+    Respeta FILE_RETENTION_HOURS por entrada: las coordenadas más antiguas se
+    descartan. Cada resultado conserva su fecha de guardado en 'saved_at'.
+    """
+    try:
+        with open(settings.GEOCODE_CACHE_FILE, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(entries, dict):
+        return {}  # Archivo con otra estructura: se ignora igual que uno corrupto
+    
+    cutoff = time.time() - settings.FILE_RETENTION_HOURS * 3600
+    cache = {}
+    for key, entry in entries.items():
+        try:
+            saved_at, lat, lon, method = entry
+        except (TypeError, ValueError):
+            continue
+        if isinstance(saved_at, (int, float)) and saved_at >= cutoff:
+            cache[key] = {'lat': lat, 'lon': lon, 'method': method, 'saved_at': saved_at}
+    return cache
+
+
+def persist_geocode_cache(cache: dict) -> None:
+    """
+    Guarda la caché de geocodificación en disco para reutilizarla entre sesiones.
+    
+    Solo se guardan coordenadas y método en JSON: display_name de Nominatim es
+    la dirección completa y no debe salir de la memoria de la sesión. Cada
+    entrada conserva su fecha original (reutilizarla no extiende su retención)
+    y las vencidas se eliminan del archivo en cada escritura.
+    """
+    now = time.time()
+    cutoff = now - settings.FILE_RETENTION_HOURS * 3600
+    entries = {}
+    for key, result in cache.items():
+        saved_at = result.setdefault('saved_at', now)
+        if saved_at >= cutoff:
+            entries[key] = [saved_at, result['lat'], result['lon'], result.get('method', 'unknown')]
+    try:
+        settings.GEOCODE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(settings.GEOCODE_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+    except OSError:
+        pass  # La caché en disco es opcional: si falla, solo se pierde el atajo
 
 
 # ==================== CONFIGURACIÓN DE PÁGINA ====================
@@ -69,7 +933,7 @@ st.set_page_config(
 )
 
 from app.utils.styles import load_css
-from app.utils.components import render_page_header
+from app.utils.components import render_page_header, render_metrics_row
 from app.utils.pdf_generator import generate_data_quality_pdf
 
 # Cargar estilos globales
@@ -140,23 +1004,13 @@ with tab2:
         if st.button("🎲 Cargar Datos Simulados", type="primary", use_container_width=True):
             try:
                 # Intentar cargar desde múltiples ubicaciones posibles
-                possible_paths = [
-                    '../../data/datos_simulados_valencia_suicidios_1980_2025.csv',  # TU UBICACIÓN: Desde app/pages/ → data/ en raíz ✅
-                    '../data/datos_simulados_valencia_suicidios_1980_2025.csv',  # Desde app/ → data/
-                    'data/datos_simulados_valencia_suicidios_1980_2025.csv',  # Si ejecutas desde raíz del proyecto
-                    'app/data/datos_simulados_valencia_suicidios_1980_2025.csv',  # Estructura alternativa
-                    'datos_simulados_valencia_suicidios_1980_2025.csv',  # Mismo directorio (fallback)
-                    '/mnt/user-data/outputs/datos_simulados_valencia_suicidios_1980_2025.csv'  # Desarrollo/testing
-                ]
-                
-                simulated_path = None
-                for path in possible_paths:
-                    if Path(path).exists():
-                        simulated_path = path
-                        st.info(f"✅ Archivo encontrado en: `{path}`")
-                        break
+                simulated_path = find_simulated_csv()
+                if simulated_path is not None:
+                    st.info(f"✅ Archivo encontrado en: `{simulated_path}`")
                 
                 if simulated_path is None:
+                    # No memorizar el fallo: el archivo puede copiarse sin reiniciar la app
+                    find_simulated_csv.clear()
                     st.error("❌ Archivo de datos simulados no encontrado")
                     st.info("""
                     💡 **El sistema busca el archivo en estas ubicaciones (en orden):**
@@ -176,7 +1030,7 @@ with tab2:
                     """)
                     st.stop()
                 
-                df = pd.read_csv(simulated_path)
+                df = load_simulated_dataset(simulated_path)
                 
                 st.session_state.df_loaded = df
                 st.session_state.using_simulated = True
@@ -205,11 +1059,9 @@ elif uploaded_file:
 
 if df is None and uploaded_file:
     try:
-        # Leer datos según extensión
-        if uploaded_file.name.endswith('.csv'):
-            df = pd.read_csv(uploaded_file)
-        else:
-            df = pd.read_excel(uploaded_file)
+        # Leer datos según extensión (cacheado por contenido del archivo)
+        ext = '.csv' if uploaded_file.name.endswith('.csv') else Path(uploaded_file.name).suffix
+        df = load_uploaded(uploaded_file.getvalue(), ext)
         
         # Validación básica
         if df.empty:
@@ -228,7 +1080,8 @@ if df is None and uploaded_file:
         with col3:
             st.metric("Memoria", f"{df.memory_usage(deep=True).sum() / 1024**2:.2f} MB")
         with col4:
-            missing_pct = (df.isnull().sum().sum() / (len(df) * len(df.columns))) * 100
+            # Una sola reducción NumPy sobre la máscara 2D de faltantes
+            missing_pct = df.isna().to_numpy().mean() * 100
             st.metric("Datos Faltantes", f"{missing_pct:.1f}%")
         
         # Preview de datos
@@ -253,11 +1106,14 @@ if df is not None:
         with st.spinner("Ejecutando análisis paralelo..."):
             try:
                 # Ejecutar análisis (devuelve tupla de 3 elementos)
-                results, df_anonymized, consolidated = run_parallel_analysis(df)
+                # Huella calculada una sola vez: clave de la caché y de session_state
+                df_key = dataframe_fingerprint(df)
+                results, df_anonymized, consolidated = cached_parallel_analysis(df_key, df)
                 
                 # Guardar en session_state
                 st.session_state.results = results
                 st.session_state.df = df
+                st.session_state.df_key = df_key
                 st.session_state.df_anonymized = df_anonymized
                 st.session_state.consolidated = consolidated
                 st.session_state.uploaded_file = uploaded_file
@@ -272,177 +1128,149 @@ if df is not None:
     if 'results' in st.session_state:
         results = st.session_state.results
         df = st.session_state.df
+        if 'df_key' not in st.session_state:
+            st.session_state.df_key = dataframe_fingerprint(df)
+        df_key = st.session_state.df_key
         
         st.divider()
         st.header("3. Resultados del Análisis")
         
         # ========== 3.2 COMPLETITUD DE DATOS ==========
-        with st.expander("✅ Análisis de Completitud", expanded=False):
-            completeness = results.get('completitud', {})
+        if st.toggle("✅ Análisis de Completitud", key="show_completitud"):
+            with st.container(border=True):
+                completeness = results.get('completitud', {})
             
-            if completeness:
-                # CORRECCIÓN: Usar 'columns_analysis' en lugar de 'missing_by_column'
-                columns_analysis = completeness.get('columns_analysis', {})
-                summary = completeness.get('summary', {})
-                
-                # Extraer métricas del summary
-                total_vars = summary.get('total_columns', 0)
-                overall_completeness = 100 - summary.get('missing_percentage', 0)
+                if completeness:
+                    # CORRECCIÓN: Usar 'columns_analysis' en lugar de 'missing_by_column'
+                    columns_analysis = completeness.get('columns_analysis', {})
+                    summary = completeness.get('summary', {})
                 
-                # Calcular variables completas (missing_rate == 0)
-                complete_vars = sum(1 for col_data in columns_analysis.values() 
-                                   if col_data.get('missing_rate', 1) == 0)
+                    # Extraer métricas del summary
+                    total_vars = summary.get('total_columns', 0)
+                    overall_completeness = 100 - summary.get('missing_percentage', 0)
                 
-                # Variables críticas (>50% missing = missing_rate > 0.5)
-                critical_vars = [col for col, data in columns_analysis.items() 
-                                if data.get('missing_rate', 0) > 0.5]
-                critical_total = len(critical_vars)
+                    # Variables completas, críticas (>50% missing) y top 5 en una sola pasada
+                    complete_vars, critical_vars, top_missing = completeness_stats(columns_analysis)
+                    critical_total = len(critical_vars)
                 
-                col1, col2 = st.columns(2)
+                    col1, col2 = st.columns(2)
                 
-                with col1:
-                    st.subheader("Estadísticas Generales")
-                    st.write(f"**Completitud Global:** {overall_completeness:.1f}%")
-                    st.write(f"**Variables Completas:** {complete_vars}/{total_vars}")
-                    st.write(f"**Variables Críticas:** {critical_total}")
+                    with col1:
+                        st.subheader("Estadísticas Generales")
+                        st.write(f"**Completitud Global:** {overall_completeness:.1f}%")
+                        st.write(f"**Variables Completas:** {complete_vars}/{total_vars}")
+                        st.write(f"**Variables Críticas:** {critical_total}")
                     
-                    if critical_total > 0:
-                        st.warning(f"⚠️ {critical_total} variable(s) con >50% de datos faltantes")
+                        if critical_total > 0:
+                            st.warning(f"⚠️ {critical_total} variable(s) con >50% de datos faltantes")
                 
-                with col2:
-                    st.subheader("Top 5 Variables Incompletas")
-                    if columns_analysis:
-                        # Ordenar por missing_rate (mayor a menor)
-                        top_missing = sorted(
-                            columns_analysis.items(), 
-                            key=lambda x: x[1].get('missing_rate', 0), 
-                            reverse=True
-                        )[:5]
-                        
-                        for col_name, col_data in top_missing:
-                            missing_pct = col_data.get('missing_rate', 0) * 100
-                            st.write(f"**{col_name}:** {missing_pct:.1f}% faltante")
+                    with col2:
+                        st.subheader("Top 5 Variables Incompletas")
+                        if columns_analysis:
+                            for col_name, missing_rate in top_missing:
+                                st.write(f"**{col_name}:** {missing_rate * 100:.1f}% faltante")
                 
-                # Heatmap de valores faltantes
-                st.subheader("Mapa de Calor de Datos Faltantes")
-                try:
-                    heatmap_data = get_missing_heatmap_data(df)
-                    if heatmap_data is not None:
-                        fig = px.imshow(
-                            heatmap_data,
-                            labels=dict(x="Variables", y="Registros", color="Faltante"),
-                            color_continuous_scale=['#0A1A2F', '#FF5F9E'],
-                            aspect="auto"
-                        )
-                        fig.update_layout(height=400)
-                        st.plotly_chart(fig, use_container_width=True)
-                except Exception as e:
-                    st.warning(f"No se pudo generar el heatmap: {str(e)}")
+                    # Heatmap de valores faltantes
+                    st.subheader("Mapa de Calor de Datos Faltantes")
+                    try:
+                        heatmap_data = cached_missing_heatmap(df)
+                        if heatmap_data is not None:
+                            fig = px.imshow(
+                                heatmap_data,
+                                labels=dict(x="Variables", y="Registros", color="Faltante"),
+                                color_continuous_scale=['#0A1A2F', '#FF5F9E'],
+                                aspect="auto"
+                            )
+                            fig.update_layout(height=400)
+                            st.plotly_chart(fig, use_container_width=True)
+                    except Exception as e:
+                        st.warning(f"No se pudo generar el heatmap: {str(e)}")
         
         # ========== 3.3 CALIDAD DE DATOS ==========
-        with st.expander("🎯 Análisis de Calidad", expanded=False):
-            quality = results.get('tipos', {})
+        if st.toggle("🎯 Análisis de Calidad", key="show_calidad"):
+            with st.container(border=True):
+                quality = results.get('tipos', {})
             
-            if quality:
-                # Extraer métricas de calidad
-                summary = quality.get('summary', {})
-                total_columns = summary.get('total_columns', 0)
-                inconsistencies_count = summary.get('inconsistencies_count', 0)
-                encoding_issues_count = summary.get('encoding_issues_count', 0)
-                quality_score = summary.get('quality_score', 0)
+                if quality:
+                    # Extraer métricas de calidad
+                    summary = quality.get('summary', {})
+                    total_columns = summary.get('total_columns', 0)
+                    inconsistencies_count = summary.get('inconsistencies_count', 0)
+                    encoding_issues_count = summary.get('encoding_issues_count', 0)
+                    quality_score = summary.get('quality_score', 0)
                 
-                # Métricas principales
-                col1, col2, col3 = st.columns(3)
+                    # Métricas principales
+                    col1, col2, col3 = st.columns(3)
                 
-                with col1:
-                    st.metric("Total Columnas", total_columns)
+                    with col1:
+                        st.metric("Total Columnas", total_columns)
                 
-                with col2:
-                    st.metric("Inconsistencias", inconsistencies_count)
+                    with col2:
+                        st.metric("Inconsistencias", inconsistencies_count)
                 
-                with col3:
-                    st.metric("Puntuación Calidad", f"{quality_score:.1f}%")
+                    with col3:
+                        st.metric("Puntuación Calidad", f"{quality_score:.1f}%")
                 
-                st.divider()
+                    st.divider()
                 
-                # ===== DETALLE DE INCONSISTENCIAS =====
-                if inconsistencies_count > 0:
-                    st.subheader("⚠️ Detalle de Inconsistencias Detectadas")
+                    # ===== DETALLE DE INCONSISTENCIAS =====
+                    if inconsistencies_count > 0:
+                        st.subheader("⚠️ Detalle de Inconsistencias Detectadas")
                     
-                    columns_analysis = quality.get('columns_analysis', {})
+                        columns_analysis = quality.get('columns_analysis', {})
                     
-                    # Filtrar columnas con problemas
-                    problematic_cols = []
-                    for col_name, col_data in columns_analysis.items():
-                        issues = []
-                        
-                        # Verificar tipo de datos
-                        inferred_type = col_data.get('inferred_type', 'unknown')
-                        mixed_types = col_data.get('mixed_types', False)
-                        
-                        if mixed_types:
-                            issues.append("🔴 Tipos de datos mezclados")
-                        
-                        # Verificar problemas de encoding
-                        encoding_issues = col_data.get('encoding_issues', False)
-                        if encoding_issues:
-                            issues.append("🔴 Problemas de codificación de caracteres")
-                        
-                        # Verificar inconsistencias semánticas
-                        semantic_issues = col_data.get('semantic_inconsistencies', [])
-                        if semantic_issues:
-                            for issue in semantic_issues:
-                                issues.append(f"🟡 {issue}")
-                        
-                        # Verificar patrones anómalos
-                        pattern_issues = col_data.get('pattern_anomalies', [])
-                        if pattern_issues:
-                            for issue in pattern_issues:
-                                issues.append(f"🟠 {issue}")
-                        
-                        if issues:
-                            problematic_cols.append({
-                                'Variable': col_name,
-                                'Tipo Inferido': inferred_type,
-                                'Problemas': issues
-                            })
+                        # Filtrar columnas con problemas
+                        typology_df = typology_columns_frame(columns_analysis)
+                        issues = [
+                            (["🔴 Tipos de datos mezclados"] if mixed else [])
+                            + (["🔴 Problemas de codificación de caracteres"] if encoding else [])
+                            + [f"🟡 {issue}" for issue in semantic_issues]
+                            + [f"🟠 {issue}" for issue in pattern_issues]
+                            for mixed, encoding, semantic_issues, pattern_issues in zip(
+                                typology_df['mixed_types'],
+                                typology_df['encoding_issues'],
+                                typology_df['semantic_inconsistencies'],
+                                typology_df['pattern_anomalies']
+                            )
+                        ]
+                        has_issues = np.fromiter(map(bool, issues), dtype=bool, count=len(issues))
+                        problematic_df = pd.DataFrame({
+                            'Variable': typology_df.index[has_issues],
+                            'Tipo Inferido': typology_df['inferred_type'].to_numpy()[has_issues],
+                            # st.dataframe no muestra saltos de línea: problemas separados por "; "
+                            'Problemas': ['; '.join(problems) for problems, flag in zip(issues, has_issues) if flag]
+                        })
                     
-                    if problematic_cols:
-                        for item in problematic_cols:
-                            with st.container():
-                                st.markdown(f"**{item['Variable']}** (Tipo: `{item['Tipo Inferido']}`)")
-                                for problem in item['Problemas']:
-                                    st.markdown(f"  - {problem}")
-                                st.markdown("---")
+                        if not problematic_df.empty:
+                            # Una sola tabla en lugar de un widget por variable y problema
+                            st.dataframe(problematic_df, use_container_width=True, hide_index=True)
+                        else:
+                            st.info("ℹ️ No se encontraron detalles específicos de las inconsistencias")
                     else:
-                        st.info("ℹ️ No se encontraron detalles específicos de las inconsistencias")
-                else:
-                    st.success("✅ No se detectaron inconsistencias en los datos")
+                        st.success("✅ No se detectaron inconsistencias en los datos")
                 
-                st.divider()
+                    st.divider()
                 
-                # ===== TABLA DE CALIDAD POR VARIABLE =====
-                st.subheader("📊 Resumen de Calidad por Variable")
+                    # ===== TABLA DE CALIDAD POR VARIABLE =====
+                    st.subheader("📊 Resumen de Calidad por Variable")
                 
-                columns_analysis = quality.get('columns_analysis', {})
-                if columns_analysis:
-                    # Crear DataFrame resumido
-                    quality_summary = []
-                    for col_name, col_data in columns_analysis.items():
-                        quality_summary.append({
-                            'Variable': col_name,
-                            'Tipo': col_data.get('inferred_type', 'unknown'),
-                            'Valores Únicos': col_data.get('unique_count', 0),
-                            'Tipos Mezclados': '❌' if col_data.get('mixed_types', False) else '✅',
-                            'Problemas Encoding': '❌' if col_data.get('encoding_issues', False) else '✅',
-                            'Estado': '⚠️ Revisar' if (col_data.get('mixed_types', False) or 
-                                                       col_data.get('encoding_issues', False)) else '✅ OK'
+                    columns_analysis = quality.get('columns_analysis', {})
+                    if columns_analysis:
+                        # Crear DataFrame resumido (vectorizado sobre el análisis por columna)
+                        typology_df = typology_columns_frame(columns_analysis)
+                        mixed = typology_df['mixed_types'].to_numpy()
+                        encoding = typology_df['encoding_issues'].to_numpy()
+                        quality_df = pd.DataFrame({
+                            'Variable': typology_df.index,
+                            'Tipo': typology_df['inferred_type'].to_numpy(),
+                            'Valores Únicos': typology_df['unique_count'].to_numpy(),
+                            'Tipos Mezclados': np.where(mixed, '❌', '✅'),
+                            'Problemas Encoding': np.where(encoding, '❌', '✅'),
+                            'Estado': np.where(mixed | encoding, '⚠️ Revisar', '✅ OK')
                         })
-                    
-                    quality_df = pd.DataFrame(quality_summary)
-                    st.dataframe(quality_df, use_container_width=True, hide_index=True)
-                else:
-                    st.warning("No hay información detallada de calidad por columna")
+                        st.dataframe(quality_df, use_container_width=True, hide_index=True)
+                    else:
+                        st.warning("No hay información detallada de calidad por columna")
         
         # ========== 3.4 DETECCIÓN DE PII ==========
         with st.expander("🔒 Privacidad y Anonimización", expanded=False):
@@ -479,234 +1307,207 @@ if df is not None:
                     st.success("✅ Riesgo BAJO de re-identificación")
         
         # ========== 3.5 VIABILIDAD PARA ANÁLISIS ESTADÍSTICO Y ML ==========
-        with st.expander("🤖 Viabilidad para Análisis Estadístico y Machine Learning", expanded=False):
-            ml = results.get('ml', {})
+        if st.toggle("🤖 Viabilidad para Análisis Estadístico y Machine Learning", key="show_ml"):
+            with st.container(border=True):
+                ml = results.get('ml', {})
             
-            if ml:
-                viability = ml.get('overall_viability', 0)
+                if ml:
+                    viability = ml.get('overall_viability', 0)
                 
-                # Gauge de viabilidad
-                fig = go.Figure(go.Indicator(
-                    mode="gauge+number+delta",
-                    value=viability * 100,
-                    domain={'x': [0, 1], 'y': [0, 1]},
-                    title={'text': "Viabilidad ML (%)"},
-                    delta={'reference': 65, 'increasing': {'color': "green"}},
-                    gauge={
-                        'axis': {'range': [None, 100]},
-                        'bar': {'color': "#667eea"},
-                        'steps': [
-                            {'range': [0, 33], 'color': "#FF5F9E"},
-                            {'range': [33, 66], 'color': "#FFA500"},
-                            {'range': [66, 100], 'color': "#2ecc71"}
-                        ],
-                        'threshold': {
-                            'line': {'color': "red", 'width': 4},
-                            'thickness': 0.75,
-                            'value': 65
+                    # Gauge de viabilidad
+                    fig = go.Figure(go.Indicator(
+                        mode="gauge+number+delta",
+                        value=viability * 100,
+                        domain={'x': [0, 1], 'y': [0, 1]},
+                        title={'text': "Viabilidad ML (%)"},
+                        delta={'reference': 65, 'increasing': {'color': "green"}},
+                        gauge={
+                            'axis': {'range': [None, 100]},
+                            'bar': {'color': "#667eea"},
+                            'steps': [
+                                {'range': [0, 33], 'color': "#FF5F9E"},
+                                {'range': [33, 66], 'color': "#FFA500"},
+                                {'range': [66, 100], 'color': "#2ecc71"}
+                            ],
+                            'threshold': {
+                                'line': {'color': "red", 'width': 4},
+                                'thickness': 0.75,
+                                'value': 65
+                            }
                         }
-                    }
-                ))
-                fig.update_layout(height=300)
-                st.plotly_chart(fig, use_container_width=True)
+                    ))
+                    fig.update_layout(height=300)
+                    st.plotly_chart(fig, use_container_width=True)
                 
-                # Razones de viabilidad
-                reasons = ml.get('reasons', [])
-                if reasons:
-                    st.subheader("Factores Evaluados")
-                    for reason in reasons:
-                        st.write(f"• {reason}")
+                    # Razones de viabilidad
+                    reasons = ml.get('reasons', [])
+                    if reasons:
+                        st.subheader("Factores Evaluados")
+                        for reason in reasons:
+                            st.write(f"• {reason}")
                 
-                st.divider()
+                    st.divider()
                 
-                # ===== ANÁLISIS DESCRIPTIVO RÁPIDO =====
-                st.subheader("📊 Análisis Descriptivo Rápido")
+                    # ===== ANÁLISIS DESCRIPTIVO RÁPIDO =====
+                    st.subheader("📊 Análisis Descriptivo Rápido")
                 
-                # Identificar tipos de variables
-                numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-                categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-                datetime_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
+                    # Identificar tipos de variables
+                    numeric_cols, categorical_cols, datetime_cols = classify_columns(df)
                 
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    st.metric("Variables Numéricas", len(numeric_cols))
-                with col2:
-                    st.metric("Variables Categóricas", len(categorical_cols))
-                with col3:
-                    st.metric("Variables Temporales", len(datetime_cols))
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Variables Numéricas", len(numeric_cols))
+                    with col2:
+                        st.metric("Variables Categóricas", len(categorical_cols))
+                    with col3:
+                        st.metric("Variables Temporales", len(datetime_cols))
                 
-                # ===== MATRIZ DE CORRELACIÓN =====
-                if len(numeric_cols) > 1:
-                    st.subheader("🔗 Matriz de Correlaciones")
+                    # ===== MATRIZ DE CORRELACIÓN =====
+                    if len(numeric_cols) > 1:
+                        st.subheader("🔗 Matriz de Correlaciones")
                     
-                    # Calcular correlaciones
-                    corr_matrix = df[numeric_cols].corr()
+                        # Calcular correlaciones
+                        corr_matrix = cached_correlation_matrix(df, tuple(numeric_cols))
                     
-                    # Crear heatmap
-                    fig_corr = px.imshow(
-                        corr_matrix,
-                        labels=dict(x="Variables", y="Variables", color="Correlación"),
-                        x=corr_matrix.columns,
-                        y=corr_matrix.columns,
-                        color_continuous_scale='RdBu_r',
-                        aspect="auto",
-                        zmin=-1,
-                        zmax=1
-                    )
-                    fig_corr.update_layout(
-                        height=500,
-                        title="Matriz de Correlación de Variables Numéricas"
-                    )
-                    st.plotly_chart(fig_corr, use_container_width=True)
+                        # Crear heatmap
+                        fig_corr = px.imshow(
+                            corr_matrix,
+                            labels=dict(x="Variables", y="Variables", color="Correlación"),
+                            x=corr_matrix.columns,
+                            y=corr_matrix.columns,
+                            color_continuous_scale='RdBu_r',
+                            aspect="auto",
+                            zmin=-1,
+                            zmax=1
+                        )
+                        fig_corr.update_layout(
+                            height=500,
+                            title="Matriz de Correlación de Variables Numéricas"
+                        )
+                        st.plotly_chart(fig_corr, use_container_width=True)
                     
-                    # Identificar correlaciones fuertes
-                    st.subheader("🎯 Correlaciones Más Fuertes")
-                    strong_corr = []
-                    for i in range(len(corr_matrix.columns)):
-                        for j in range(i+1, len(corr_matrix.columns)):
-                            corr_val = corr_matrix.iloc[i, j]
-                            if abs(corr_val) > 0.5:  # Umbral de correlación fuerte
-                                strong_corr.append({
-                                    'Variable 1': corr_matrix.columns[i],
-                                    'Variable 2': corr_matrix.columns[j],
-                                    'Correlación': f"{corr_val:.3f}",
-                                    'Intensidad': '🔴 Muy Fuerte' if abs(corr_val) > 0.8 else '🟠 Fuerte'
-                                })
+                        # Identificar correlaciones fuertes
+                        st.subheader("🎯 Correlaciones Más Fuertes")
+                        # Triángulo superior de la matriz (sin diagonal), vectorizado
+                        corr_cols = corr_matrix.columns.to_numpy()
+                        i_idx, j_idx = np.triu_indices(len(corr_cols), k=1)
+                        corr_vals = corr_matrix.to_numpy()[i_idx, j_idx]
+                        strong_mask = np.abs(corr_vals) > 0.5  # Umbral de correlación fuerte
+                        strong_vals = corr_vals[strong_mask]
+                        strong_corr = pd.DataFrame({
+                            'Variable 1': corr_cols[i_idx[strong_mask]],
+                            'Variable 2': corr_cols[j_idx[strong_mask]],
+                            'Correlación': np.char.mod('%.3f', strong_vals),
+                            'Intensidad': np.where(np.abs(strong_vals) > 0.8, '🔴 Muy Fuerte', '🟠 Fuerte')
+                        })
                     
-                    if strong_corr:
-                        st.dataframe(pd.DataFrame(strong_corr), use_container_width=True, hide_index=True)
+                        if not strong_corr.empty:
+                            st.dataframe(strong_corr, use_container_width=True, hide_index=True)
+                        else:
+                            st.info("No se detectaron correlaciones fuertes (>0.5) entre variables")
                     else:
-                        st.info("No se detectaron correlaciones fuertes (>0.5) entre variables")
-                else:
-                    st.warning("Se necesitan al menos 2 variables numéricas para calcular correlaciones")
+                        st.warning("Se necesitan al menos 2 variables numéricas para calcular correlaciones")
                 
-                st.divider()
+                    st.divider()
                 
-                # ===== ANÁLISIS ESTADÍSTICOS VIABLES =====
-                st.subheader("📈 Análisis Estadísticos Recomendados")
+                    # ===== ANÁLISIS ESTADÍSTICOS VIABLES =====
+                    st.subheader("📈 Análisis Estadísticos Recomendados")
                 
-                analisis_viables = []
+                    analisis_viables = []
                 
-                # Análisis descriptivo básico
-                if len(numeric_cols) > 0:
-                    analisis_viables.append({
-                        'Análisis': 'Estadística Descriptiva',
-                        'Viabilidad': '✅ Alta',
-                        'Descripción': f'Media, mediana, desviación estándar para {len(numeric_cols)} variables numéricas'
-                    })
+                    # Análisis descriptivo básico
+                    if len(numeric_cols) > 0:
+                        analisis_viables.append({
+                            'Análisis': 'Estadística Descriptiva',
+                            'Viabilidad': '✅ Alta',
+                            'Descripción': f'Media, mediana, desviación estándar para {len(numeric_cols)} variables numéricas'
+                        })
                 
-                # Test de hipótesis
-                if len(numeric_cols) >= 2:
-                    analisis_viables.append({
-                        'Análisis': 'Tests de Hipótesis',
-                        'Viabilidad': '✅ Alta',
-                        'Descripción': 'T-test, ANOVA, pruebas de normalidad y homocedasticidad'
-                    })
+                    # Test de hipótesis
+                    if len(numeric_cols) >= 2:
+                        analisis_viables.append({
+                            'Análisis': 'Tests de Hipótesis',
+                            'Viabilidad': '✅ Alta',
+                            'Descripción': 'T-test, ANOVA, pruebas de normalidad y homocedasticidad'
+                        })
                 
-                # Análisis de series temporales
-                if len(datetime_cols) > 0 and len(numeric_cols) > 0:
-                    analisis_viables.append({
-                        'Análisis': 'Series Temporales',
-                        'Viabilidad': '✅ Alta',
-                        'Descripción': f'Análisis de tendencias, estacionalidad con {len(datetime_cols)} variable(s) temporal(es)'
-                    })
+                    # Análisis de series temporales
+                    if len(datetime_cols) > 0 and len(numeric_cols) > 0:
+                        analisis_viables.append({
+                            'Análisis': 'Series Temporales',
+                            'Viabilidad': '✅ Alta',
+                            'Descripción': f'Análisis de tendencias, estacionalidad con {len(datetime_cols)} variable(s) temporal(es)'
+                        })
                 
-                # Análisis de varianza
-                if len(categorical_cols) > 0 and len(numeric_cols) > 0:
-                    analisis_viables.append({
-                        'Análisis': 'ANOVA / Chi-cuadrado',
-                        'Viabilidad': '✅ Alta',
-                        'Descripción': 'Comparación entre grupos categóricos'
-                    })
+                    # Análisis de varianza
+                    if len(categorical_cols) > 0 and len(numeric_cols) > 0:
+                        analisis_viables.append({
+                            'Análisis': 'ANOVA / Chi-cuadrado',
+                            'Viabilidad': '✅ Alta',
+                            'Descripción': 'Comparación entre grupos categóricos'
+                        })
                 
-                # Regresión
-                if len(numeric_cols) >= 2:
-                    analisis_viables.append({
-                        'Análisis': 'Regresión Lineal/Múltiple',
-                        'Viabilidad': '✅ Alta',
-                        'Descripción': 'Modelar relaciones entre variables numéricas'
-                    })
+                    # Regresión
+                    if len(numeric_cols) >= 2:
+                        analisis_viables.append({
+                            'Análisis': 'Regresión Lineal/Múltiple',
+                            'Viabilidad': '✅ Alta',
+                            'Descripción': 'Modelar relaciones entre variables numéricas'
+                        })
                 
-                if analisis_viables:
-                    st.dataframe(pd.DataFrame(analisis_viables), use_container_width=True, hide_index=True)
+                    if analisis_viables:
+                        st.dataframe(pd.DataFrame(analisis_viables), use_container_width=True, hide_index=True)
                 
-                st.divider()
+                    st.divider()
                 
-                # ===== MODELOS PREDICTIVOS VIABLES =====
-                st.subheader("🎯 Modelos Predictivos Recomendados")
+                    # ===== MODELOS PREDICTIVOS VIABLES =====
+                    st.subheader("🎯 Modelos Predictivos Recomendados")
                 
-                features = ml.get('features_for_ml', [])
+                    features = ml.get('features_for_ml', [])
                 
-                if features and len(features) > 0:
-                    st.info(f"💡 Se identificaron **{len(features)} variables** útiles para modelado: {', '.join(features[:5])}{'...' if len(features) > 5 else ''}")
-                    
-                    modelos_recomendados = []
-                    
-                    # Clasificación
-                    if len(categorical_cols) > 0:
-                        modelos_recomendados.append({
-                            'Tipo': 'Clasificación',
-                            'Modelos': 'Regresión Logística, Random Forest, XGBoost',
-                            'Caso de Uso': 'Predecir categorías (ej: riesgo alto/bajo, tipo de evento)',
-                            'Prioridad': '🔴 Alta'
-                        })
-                    
-                    # Regresión
-                    if len(numeric_cols) >= 2:
-                        modelos_recomendados.append({
-                            'Tipo': 'Regresión',
-                            'Modelos': 'Regresión Lineal, Random Forest Regressor, Gradient Boosting',
-                            'Caso de Uso': 'Predecir valores continuos (ej: tasa, score, cantidad)',
-                            'Prioridad': '🔴 Alta'
-                        })
+                    if features and len(features) > 0:
+                        st.info(f"💡 Se identificaron **{len(features)} variables** útiles para modelado: {', '.join(features[:5])}{'...' if len(features) > 5 else ''}")
                     
-                    # Series temporales
-                    if len(datetime_cols) > 0:
-                        modelos_recomendados.append({
-                            'Tipo': 'Series Temporales',
-                            'Modelos': 'ARIMA, Prophet, LSTM',
-                            'Caso de Uso': 'Predecir tendencias futuras basadas en histórico',
-                            'Prioridad': '🟠 Media' if len(df) < 100 else '🔴 Alta'
-                        })
-                    
-                    # Clustering
-                    if len(numeric_cols) >= 3:
-                        modelos_recomendados.append({
-                            'Tipo': 'Clustering',
-                            'Modelos': 'K-Means, DBSCAN, Hierarchical',
-                            'Caso de Uso': 'Identificar grupos naturales en los datos',
-                            'Prioridad': '🟡 Baja'
-                        })
-                    
-                    # Detección de anomalías
-                    if len(numeric_cols) >= 2:
-                        modelos_recomendados.append({
-                            'Tipo': 'Detección de Anomalías',
-                            'Modelos': 'Isolation Forest, One-Class SVM, Autoencoders',
-                            'Caso de Uso': 'Identificar casos atípicos o eventos inusuales',
-                            'Prioridad': '🟠 Media'
-                        })
+                        # Filtrar el catálogo según las columnas disponibles
+                        clasificacion, regresion, series, clustering, anomalias = MODEL_CATALOG
+                        if len(df) < 100:
+                            series = series._replace(prioridad=PRIORIDAD_MEDIA)
+                        modelos_recomendados = [
+                            modelo for modelo, viable in zip(
+                                (clasificacion, regresion, series, clustering, anomalias),
+                                (
+                                    len(categorical_cols) > 0,
+                                    len(numeric_cols) >= 2,
+                                    len(datetime_cols) > 0,
+                                    len(numeric_cols) >= 3,
+                                    len(numeric_cols) >= 2
+                                )
+                            )
+                            if viable
+                        ]
                     
-                    if modelos_recomendados:
-                        st.dataframe(pd.DataFrame(modelos_recomendados), use_container_width=True, hide_index=True)
+                        if modelos_recomendados:
+                            st.dataframe(
+                                pd.DataFrame.from_records(modelos_recomendados, columns=MODEL_CATALOG_COLUMNS),
+                                use_container_width=True,
+                                hide_index=True
+                            )
                         
-                        st.success(f"✅ Dataset viable para **{len(modelos_recomendados)}** tipos de modelado predictivo")
+                            st.success(f"✅ Dataset viable para **{len(modelos_recomendados)}** tipos de modelado predictivo")
+                        else:
+                            st.warning("Dataset tiene viabilidad limitada para modelado predictivo")
                     else:
-                        st.warning("Dataset tiene viabilidad limitada para modelado predictivo")
-                else:
-                    st.warning("No se identificaron suficientes features para modelado ML")
+                        st.warning("No se identificaron suficientes features para modelado ML")
         
         # ========== 3.6 ANÁLISIS SEMÁNTICO ==========
         with st.expander("🔍 Análisis Semántico", expanded=False):
             semantic = results.get('semantica', {})
             
             if semantic:
-                # Obtener summary
-                summary = semantic.get('summary', {})
-                total_issues = summary.get('total_issues', 0)
-                critical_issues = summary.get('critical_issues', 0)
-                score = summary.get('score', 100)
-                quality_level = summary.get('quality_level', 'excelente')
+                # Métricas e issues (cacheados por dataset)
+                (score, total_issues, critical_issues, quality_level,
+                 edad_invalida, fechas_incoherentes, metodos_no_estandarizados,
+                 valores_imposibles) = semantic_payload(df_key, semantic)
                 
                 # Métricas principales
                 col1, col2, col3 = st.columns(3)
@@ -733,32 +1534,24 @@ if df is not None:
                     st.subheader("⚠️ Problemas Detectados")
                     
                     # Edades inválidas
-                    edad_invalida = semantic.get('edad_invalida', [])
                     if edad_invalida:
                         st.warning("**Edades Inválidas:**")
-                        for issue in edad_invalida:
-                            st.write(f"  • {issue}")
+                        st.markdown("\n".join(f"- {issue}" for issue in edad_invalida))
                     
                     # Fechas incoherentes
-                    fechas_incoherentes = semantic.get('fechas_incoherentes', [])
                     if fechas_incoherentes:
                         st.warning("**Fechas Incoherentes:**")
-                        for issue in fechas_incoherentes:
-                            st.write(f"  • {issue}")
+                        st.markdown("\n".join(f"- {issue}" for issue in fechas_incoherentes))
                     
                     # Métodos no estandarizados
-                    metodos_no_estandarizados = semantic.get('metodos_no_estandarizados', [])
                     if metodos_no_estandarizados:
                         st.warning("**Métodos No Estandarizados:**")
-                        for issue in metodos_no_estandarizados:
-                            st.write(f"  • {issue}")
+                        st.markdown("\n".join(f"- {issue}" for issue in metodos_no_estandarizados))
                     
                     # Valores imposibles
-                    valores_imposibles = semantic.get('valores_imposibles', [])
                     if valores_imposibles:
                         st.error("**Valores Imposibles:**")
-                        for issue in valores_imposibles:
-                            st.write(f"  • {issue}")
+                        st.markdown("\n".join(f"- {issue}" for issue in valores_imposibles))
                 else:
                     st.success("✅ **Análisis Semántico Exitoso**")
                     st.write("**No se detectaron problemas en:**")
@@ -770,23 +1563,22 @@ if df is not None:
         # ========== 3.7 ANÁLISIS GEOESPACIAL Y TEMPORAL ==========
         with st.expander("🗺️ Análisis Geoespacial y Temporal", expanded=False):
             
-            # Detectar columnas de dirección y fecha
-            address_cols = [col for col in df.columns if any(keyword in col.lower() 
-                          for keyword in ['direc', 'address', 'ubicac', 'location', 'lugar', 'domicilio', 'calle', 'street'])]
-            
-            date_cols = [col for col in df.columns if any(keyword in col.lower() 
-                        for keyword in ['fecha', 'date', 'tiempo', 'time', 'cuando', 'when'])]
+            # Detectar columnas de dirección y fecha (nombres en minúsculas, una sola vez)
+            lower_cols = df.columns.astype(str).str.lower()
+            address_cols = df.columns[lower_cols.str.contains(ADDRESS_COL_PATTERN, regex=True)].tolist()
+            date_cols = df.columns[lower_cols.str.contains(DATE_COL_PATTERN, regex=True)].tolist()
             
             # Convertir columnas datetime si existen
             for col in date_cols:
+                if pd.api.types.is_datetime64_any_dtype(df[col]):
+                    continue
                 try:
-                    if df[col].dtype != 'datetime64[ns]':
-                        df[col] = pd.to_datetime(df[col], errors='coerce')
+                    df[col] = parse_dates(df[col])
                 except:
                     pass
             
             # Actualizar date_cols después de conversión
-            datetime_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
+            datetime_cols = df.select_dtypes(include=['datetime64', 'datetimetz']).columns.tolist()
             
             st.subheader("📍 Detección de Datos Espaciales y Temporales")
             
@@ -817,8 +1609,7 @@ if df is not None:
                     # Detectar columna de comuna/ciudad
                     st.subheader("🏘️ Detección de Comuna/Ciudad")
                     
-                    comuna_keywords = ['comuna', 'ciudad', 'municipio', 'localidad', 'territorio']
-                    comuna_cols = [col for col in df.columns if any(keyword in col.lower() for keyword in comuna_keywords)]
+                    comuna_cols = df.columns[lower_cols.str.contains(COMUNA_COL_PATTERN, regex=True)].tolist()
                     
                     if comuna_cols:
                         st.success(f"✅ Columna de comuna detectada: **{', '.join(comuna_cols)}**")
@@ -854,7 +1645,7 @@ if df is not None:
                         
                         # Mostrar comunas únicas
                         with st.expander("🏘️ Comunas en los Datos", expanded=False):
-                            comunas_unicas = comunas_sample.unique()
+                            comunas_unicas = pd.unique(comunas_sample.to_numpy())
                             st.write(f"**{len(comunas_unicas)} comunas únicas detectadas:**")
                             st.write(", ".join([str(c) for c in comunas_unicas]))
                     else:
@@ -876,35 +1667,28 @@ if df is not None:
                         # Análisis de región/país/ciudad desde direcciones
                         st.subheader("🔍 Identificación de Región")
                         
-                        # Tomar muestra combinada (primeras 20 + últimas 20)
-                        sample_addresses = pd.concat([
-                            addresses_sample.head(20),
-                            addresses_sample.tail(20)
-                        ]).unique()
+                        # Tomar muestra combinada (primeras 20 + últimas 20) directamente del array
+                        n_sample = min(20, len(addresses_sample))
+                        sample_idx = np.r_[:n_sample, len(addresses_sample) - n_sample:len(addresses_sample)]
+                        sample_addresses = pd.unique(addresses_sample.to_numpy()[sample_idx])
                         
                         # Análisis simple de palabras clave en direcciones
-                        all_text = " ".join([str(addr).lower() for addr in sample_addresses if pd.notna(addr)])
+                        sample_text = sample_addresses[pd.notna(sample_addresses)].astype(str)
+                        all_text = " ".join(np.char.lower(sample_text))
                         
-                        # Detectar posibles ciudades/países comunes
-                        ciudades_spain = ['valencia', 'madrid', 'barcelona', 'sevilla', 'zaragoza', 'málaga', 
-                                         'murcia', 'palma', 'bilbao', 'alicante', 'córdoba', 'valladolid']
-                        ciudades_latam = ['santiago', 'valparaíso', 'concepción', 'valdivia', 'temuco', 
-                                         'puerto montt', 'buenos aires', 'lima', 'bogotá', 'caracas', 'quito', 
-                                         'ciudad de méxico', 'guadalajara', 'monterrey', 'medellín']
-                        
-                        detected_cities = []
-                        for ciudad in ciudades_spain + ciudades_latam:
-                            if ciudad in all_text:
-                                detected_cities.append(ciudad.title())
+                        # Detectar posibles ciudades/países comunes (una pasada de regex)
+                        hits = set(_CITY_RE.findall(all_text))
+                        detected_cities = [ciudad.title() for ciudad in _CITY_TO_REGION if ciudad in hits]
+                        detected_regions = {_CITY_TO_REGION[ciudad] for ciudad in hits}
                         
                         if detected_cities:
                             st.info(f"🏙️ Ciudades detectadas en las direcciones: **{', '.join(detected_cities)}**")
                             
                             # Estimar país/región principal
-                            if any(c.lower() in ciudades_spain for c in detected_cities):
+                            if "España" in detected_regions:
                                 st.success("📍 Región estimada: **España**")
                                 default_location = "España"
-                            elif any(c.lower() in ciudades_latam for c in detected_cities):
+                            elif "Latinoamérica" in detected_regions:
                                 st.success("📍 Región estimada: **Latinoamérica**")
                                 default_location = "Latinoamérica"
                             else:
@@ -918,37 +1702,24 @@ if df is not None:
                         # ===== DETECCIÓN AUTOMÁTICA DE COORDENADAS =====
                         st.subheader("📍 Detección de Coordenadas")
                         
-                        # Detectar si ya existen columnas de coordenadas
-                        coord_cols = {'latitud', 'longitud', 'lat', 'lon', 'latitude', 'longitude'}
-                        existing_coords = [col for col in df.columns if col.lower() in coord_cols]
-                        
-                        has_coordinates = False
-                        lat_col, lon_col = None, None
-                        
-                        if len(existing_coords) >= 2:
-                            # Intentar encontrar pares lat/lon
-                            for lat_name in ['latitud', 'lat', 'latitude']:
-                                for lon_name in ['longitud', 'lon', 'longitude']:
-                                    if lat_name in [c.lower() for c in df.columns] and lon_name in [c.lower() for c in df.columns]:
-                                        lat_col = [c for c in df.columns if c.lower() == lat_name][0]
-                                        lon_col = [c for c in df.columns if c.lower() == lon_name][0]
-                                        has_coordinates = True
-                                        break
-                                if has_coordinates:
-                                    break
+                        # Detectar si ya existen columnas de coordenadas (nombre en minúsculas → original)
+                        lower_to_col = {}
+                        for col, lower in zip(df.columns, lower_cols):
+                            lower_to_col.setdefault(lower, col)
+                        lat_col = next((lower_to_col[name] for name in ('latitud', 'lat', 'latitude') if name in lower_to_col), None)
+                        lon_col = next((lower_to_col[name] for name in ('longitud', 'lon', 'longitude') if name in lower_to_col), None)
+                        has_coordinates = lat_col is not None and lon_col is not None
                         
                         if has_coordinates:
                             # Verificar que las coordenadas no estén vacías
                             valid_coords = df[[lat_col, lon_col]].dropna()
                             if len(valid_coords) > 0:
                                 # Intentar detectar columna de ubicación/nombre
-                                location_keywords = ['ubicacion', 'barrio', 'direccion', 'localidad', 'zona', 
-                                                   'location', 'address', 'place', 'city', 'municipality']
                                 location_col = None
-                                for keyword in location_keywords:
-                                    matching = [c for c in df.columns if keyword in c.lower()]
-                                    if matching:
-                                        location_col = matching[0]
+                                for keyword in LOCATION_KEYWORDS:
+                                    matching = lower_cols.str.contains(keyword, regex=False)
+                                    if matching.any():
+                                        location_col = df.columns[matching][0]
                                         break
                                 
                                 # Si no hay columna de ubicación, usar índice o primera columna de texto
@@ -961,7 +1732,7 @@ if df is not None:
                                 
                                 # Si aún no hay, crear una columna de índice
                                 if location_col is None:
-                                    df['punto'] = [f"Punto {i+1}" for i in range(len(df))]
+                                    df['punto'] = np.char.add('Punto ', np.arange(1, len(df) + 1).astype(str))
                                     location_col = 'punto'
                                 
                                 st.success(f"""
@@ -990,18 +1761,14 @@ if df is not None:
                                 st.subheader("🗺️✨ Visualizaciones Geoespaciales Interactivas")
                                 
                                 # Preparar DataFrame con coordenadas válidas
-                                df_geo = df[[location_col, lat_col, lon_col]].copy()
-                                df_geo = df_geo.dropna(subset=[lat_col, lon_col])
-                                
-                                # Agregar columna temporal si existe
-                                if datetime_cols:
-                                    date_col = datetime_cols[0]
-                                    df_geo['fecha'] = df[date_col]
-                                    df_geo['año'] = pd.to_datetime(df[date_col], errors='coerce').dt.year
-                                    df_geo['mes'] = pd.to_datetime(df[date_col], errors='coerce').dt.month
-                                
-                                # Renombrar columnas para plotly
-                                df_geo = df_geo.rename(columns={lat_col: 'lat', lon_col: 'lon', location_col: 'ubicacion'})
+                                # (se conserva entre reruns mientras no cambien el dataset ni las columnas)
+                                date_col = datetime_cols[0] if datetime_cols else None
+                                geo_key = (df_key, location_col, lat_col, lon_col, date_col)
+                                geo_cache = st.session_state.get('_df_geo_cache')
+                                if geo_cache is None or geo_cache[0] != geo_key:
+                                    geo_cache = (geo_key, build_geo_frame(df, location_col, lat_col, lon_col, date_col))
+                                    st.session_state._df_geo_cache = geo_cache
+                                df_geo = geo_cache[1]
                                 
                                 # Tabs para diferentes visualizaciones (SOLO 2 TABS)
                                 viz_tab1, viz_tab2 = st.tabs([
@@ -1016,8 +1783,11 @@ if df is not None:
                                     if 'año' in df_geo.columns:
                                         col_filter1, col_filter2 = st.columns(2)
                                         
+                                        # Índice de filas por año (cacheado); sus claves son los años disponibles
+                                        year_groups = year_index(df_key, geo_key[1:], df_geo)
+                                        
                                         with col_filter1:
-                                            años_disponibles = sorted(df_geo['año'].dropna().unique())
+                                            años_disponibles = sorted(year_groups)
                                             año_seleccionado = st.selectbox(
                                                 "Selecciona el año a visualizar",
                                                 options=['Todos'] + [int(a) for a in años_disponibles],
@@ -1036,34 +1806,69 @@ if df is not None:
                                         
                                         # Filtrar datos según año seleccionado
                                         if año_seleccionado == 'Todos':
-                                            df_filtered = df_geo.copy()
+                                            df_filtered = df_geo
                                             title_suffix = "Todos los años"
                                         else:
-                                            df_filtered = df_geo[df_geo['año'] == año_seleccionado].copy()
+                                            year_rows = year_groups.get(año_seleccionado)
+                                            df_filtered = df_geo.take(year_rows) if year_rows is not None else df_geo.iloc[:0]
                                             title_suffix = f"Año {año_seleccionado}"
                                         
-                                        # Crear mapa de puntos mejorado
-                                        fig_points = px.scatter_mapbox(
-                                            df_filtered,
-                                            lat='lat',
-                                            lon='lon',
-                                            color='año' if año_seleccionado == 'Todos' else None,
-                                            hover_name='ubicacion',
-                                            hover_data={'lat': ':.4f', 'lon': ':.4f', 'año': True} if 'año' in df_filtered.columns else {'lat': ':.4f', 'lon': ':.4f'},
-                                            zoom=11,
-                                            mapbox_style="carto-positron",
-                                            title=f"Mapa de Eventos - {title_suffix} ({len(df_filtered):,} eventos)",
-                                            height=650,
-                                            color_continuous_scale="Turbo" if año_seleccionado == 'Todos' else None
-                                        )
-                                        
-                                        # Actualizar estilo de marcadores
-                                        fig_points.update_traces(
-                                            marker=dict(
-                                                size=point_size,
-                                                opacity=0.7
+                                        if len(df_filtered) > MAP_POINTS_LIMIT:
+                                            # Demasiados marcadores para el navegador: enviar conteos por celda
+                                            df_cells = (
+                                                df_filtered[['lat', 'lon']]
+                                                .round(MAP_CELL_DECIMALS)
+                                                .value_counts()
+                                                .reset_index(name='eventos')
+                                            )
+                                            fig_points = px.density_mapbox(
+                                                df_cells,
+                                                lat='lat',
+                                                lon='lon',
+                                                z='eventos',
+                                                radius=point_size * 2,
+                                                zoom=11,
+                                                mapbox_style="carto-positron",
+                                                title=f"Densidad de Eventos - {title_suffix} ({len(df_filtered):,} eventos)",
+                                                height=650,
+                                                color_continuous_scale="Turbo"
+                                            )
+                                        else:
+                                            # Crear mapa de puntos mejorado (traza construida directamente, sin plotly express)
+                                            color_by_year = año_seleccionado == 'Todos'
+                                            years = df_filtered['año'].to_numpy(dtype='float64', na_value=np.nan)
+                                            fig_points = go.Figure(go.Scattermapbox(
+                                                lat=df_filtered['lat'].to_numpy(),
+                                                lon=df_filtered['lon'].to_numpy(),
+                                                mode='markers',
+                                                hovertext=df_filtered['ubicacion'].astype(str).to_numpy(),
+                                                customdata=years,
+                                                hovertemplate=(
+                                                    "<b>%{hovertext}</b><br>lat=%{lat:.4f}<br>lon=%{lon:.4f}"
+                                                    "<br>año=%{customdata}<extra></extra>"
+                                                ),
+                                                marker=dict(
+                                                    size=point_size,
+                                                    opacity=0.7,
+                                                    color=years if color_by_year else None,
+                                                    colorscale="Turbo" if color_by_year else None,
+                                                    showscale=color_by_year,
+                                                    colorbar=dict(title='año') if color_by_year else None
+                                                )
+                                            ))
+                                            
+                                            # Centrar en los datos, como hace plotly express
+                                            mapbox_layout = dict(style="carto-positron", zoom=11)
+                                            if len(df_filtered) > 0:
+                                                mapbox_layout['center'] = dict(
+                                                    lat=float(df_filtered['lat'].mean()),
+                                                    lon=float(df_filtered['lon'].mean())
+                                                )
+                                            fig_points.update_layout(
+                                                mapbox=mapbox_layout,
+                                                title=f"Mapa de Eventos - {title_suffix} ({len(df_filtered):,} eventos)",
+                                                height=650
                                             )
-                                        )
                                         
                                         fig_points.update_layout(
                                             margin=dict(l=0, r=0, t=50, b=0),
@@ -1078,8 +1883,10 @@ if df is not None:
                                             st.metric("Eventos Mostrados", f"{len(df_filtered):,}")
                                         with col_stat2:
                                             if año_seleccionado != 'Todos':
-                                                ubicaciones_unicas = df_filtered[['lat', 'lon']].drop_duplicates()
-                                                st.metric("Ubicaciones Únicas", len(ubicaciones_unicas))
+                                                ubicaciones_unicas = count_unique_coords(
+                                                    df_filtered['lat'].to_numpy(), df_filtered['lon'].to_numpy()
+                                                )
+                                                st.metric("Ubicaciones Únicas", ubicaciones_unicas)
                                             else:
                                                 st.metric("Años Totales", len(años_disponibles))
                                         with col_stat3:
@@ -1125,97 +1932,49 @@ if df is not None:
                                                 key="cluster_intensity"
                                             )
                                         
-                                        # Preparar datos para animación POR AÑO
-                                        df_anim = df_geo.copy()
-                                        df_anim = df_anim.dropna(subset=['año', 'mes'])
-                                        df_anim['año'] = df_anim['año'].astype(int)
-                                        df_anim['mes'] = df_anim['mes'].astype(int)
-                                        
-                                        # Agrupar por año y ubicación para crear clusters heterogéneos
-                                        df_anim_year = df_anim.groupby(['lat', 'lon', 'año', 'ubicacion']).size().reset_index(name='eventos')
-                                        
-                                        # Crear categorías de intensidad para heterogeneidad visual
-                                        max_eventos = df_anim_year['eventos'].max()
-                                        df_anim_year['intensidad'] = pd.cut(
-                                            df_anim_year['eventos'],
-                                            bins=[0, max_eventos*0.25, max_eventos*0.5, max_eventos*0.75, max_eventos],
-                                            labels=['Baja', 'Media', 'Alta', 'Crítica'],
-                                            include_lowest=True
+                                        max_locations = st.slider(
+                                            "Máx. ubicaciones animadas",
+                                            min_value=500,
+                                            max_value=20000,
+                                            value=5000,
+                                            step=500,
+                                            help="Se animan solo las ubicaciones con más eventos para aligerar cada frame",
+                                            key="anim_max_locations"
                                         )
-                                        
-                                        # Asignar colores intensos según intensidad
-                                        color_map = {
-                                            'Baja': '#4A90E2',      # Azul
-                                            'Media': '#F5A623',     # Naranja
-                                            'Alta': '#FF6B6B',      # Rojo
-                                            'Crítica': '#FF1744'    # Rojo intenso
-                                        }
-                                        df_anim_year['color_intensidad'] = df_anim_year['intensidad'].map(color_map)
-                                        
-                                        # Crear animación con colores heterogéneos por intensidad
-                                        fig_anim = px.scatter_mapbox(
-                                            df_anim_year,
-                                            lat='lat',
-                                            lon='lon',
-                                            size='eventos',
-                                            color='intensidad',  # Usar intensidad categórica
-                                            animation_frame='año',
-                                            hover_name='ubicacion',
-                                            hover_data={
-                                                'lat': ':.4f',
-                                                'lon': ':.4f',
-                                                'eventos': True,
-                                                'intensidad': True,
-                                                'año': True
-                                            },
-                                            zoom=11,
-                                            mapbox_style="carto-darkmatter",
-                                            title="Evolución Anual - Clusters por Intensidad",
-                                            height=750,
-                                            color_discrete_map=color_map,  # Usar mapa de colores discreto
-                                            size_max=40 * cluster_size_multiplier,
-                                            category_orders={"intensidad": ['Baja', 'Media', 'Alta', 'Crítica']}
+                                        anim_max_events = st.number_input(
+                                            "Umbral de eventos para animar",
+                                            min_value=1_000,
+                                            max_value=1_000_000,
+                                            value=ANIMATION_MAX_EVENTS,
+                                            step=5_000,
+                                            help="Con más eventos se muestra un mapa de densidad estático en lugar de la animación",
+                                            key="anim_max_events"
                                         )
-                                        
-                                        # Mejorar diseño con colores para fondo oscuro
-                                        fig_anim.update_layout(
-                                            margin=dict(l=0, r=0, t=60, b=0),
-                                            coloraxis_colorbar=dict(
-                                                title=dict(
-                                                    text="Eventos",
-                                                    font=dict(color='white', size=14)  # Blanco para fondo oscuro
-                                                ),
-                                                thickness=18,
-                                                len=0.7,
-                                                tickfont=dict(color='white')  # Blanco para fondo oscuro
-                                            ),
-                                            font=dict(
-                                                size=13,
-                                                color='white'  # Blanco para fondo oscuro
-                                            ),
-                                            title=dict(
-                                                font=dict(color='white', size=16)  # Blanco para fondo oscuro
-                                            )
+                                        anim_max_years = st.number_input(
+                                            "Umbral de años para animar",
+                                            min_value=5,
+                                            max_value=500,
+                                            value=ANIMATION_MAX_YEARS,
+                                            step=5,
+                                            help="Con más años (frames) se muestra un mapa de densidad estático en lugar de la animación",
+                                            key="anim_max_years"
                                         )
                                         
-                                        # Configurar controles de animación
-                                        fig_anim.layout.updatemenus[0].buttons[0].args[1]['frame']['duration'] = anim_speed
-                                        fig_anim.layout.updatemenus[0].buttons[0].args[1]['transition']['duration'] = anim_speed // 2
-                                        
-                                        # Mejorar slider temporal
-                                        fig_anim.layout.sliders[0].pad = dict(t=60, b=15)
-                                        fig_anim.layout.sliders[0].currentvalue = dict(
-                                            prefix="Año: ",
-                                            font=dict(size=18, color='#64FFDA', family='Inter')  # Teal para destacar
-                                        )
-                                        fig_anim.layout.sliders[0].font = dict(color='white')  # Blanco para fondo oscuro
+                                        # Preparar datos para animación POR AÑO
+                                        # (año/mes como enteros naive y estrechos para todos los groupby y cálculos de periodo)
+                                        df_anim = df_geo[df_geo[['año', 'mes']].notna().all(axis=1)].astype({'año': 'int16', 'mes': 'int8'})
                                         
-                                        # Mejorar marcadores
-                                        fig_anim.update_traces(
-                                            marker=dict(
-                                                opacity=0.85
-                                            )
-                                        )
+                                        # Clusters por intensidad y figura animada (cacheados por dataset y controles)
+                                        df_anim_year, eventos_por_año = animation_aggregates(df_key, geo_key[1:], max_locations, df_anim)
+                                        if len(df_anim) > anim_max_events or len(eventos_por_año) > anim_max_years:
+                                            st.warning("⚠️ Dataset grande: se muestra la densidad acumulada en lugar de la animación.")
+                                            fig_anim = go.Figure(build_static_density_figure(
+                                                df_key, geo_key[1:], max_locations, df_anim_year
+                                            ))
+                                        else:
+                                            fig_anim = go.Figure(build_animation_figure(
+                                                df_key, geo_key[1:], max_locations, anim_speed, cluster_size_multiplier, df_anim_year
+                                            ))
                                         
                                         st.plotly_chart(fig_anim, use_container_width=True)
                                         
@@ -1233,34 +1992,15 @@ if df is not None:
                                         
                                         # Estadísticas por año
                                         st.markdown("#### 📊 Estadísticas Anuales")
-                                        eventos_por_año = df_anim.groupby('año').size().reset_index(name='total')
                                         
-                                        col1, col2, col3, col4 = st.columns(4)
-                                        with col1:
-                                            max_año = eventos_por_año.loc[eventos_por_año['total'].idxmax()]
-                                            st.metric(
-                                                "Año con más eventos",
-                                                int(max_año['año']),
-                                                f"{int(max_año['total'])} eventos"
-                                            )
-                                        with col2:
-                                            min_año = eventos_por_año.loc[eventos_por_año['total'].idxmin()]
-                                            st.metric(
-                                                "Año con menos eventos",
-                                                int(min_año['año']),
-                                                f"{int(min_año['total'])} eventos"
-                                            )
-                                        with col3:
-                                            st.metric(
-                                                "Promedio anual",
-                                                f"{eventos_por_año['total'].mean():.0f}",
-                                                f"±{eventos_por_año['total'].std():.0f}"
-                                            )
-                                        with col4:
-                                            st.metric(
-                                                "Años analizados",
-                                                len(eventos_por_año)
-                                            )
+                                        max_año = eventos_por_año.loc[eventos_por_año['total'].idxmax()]
+                                        min_año = eventos_por_año.loc[eventos_por_año['total'].idxmin()]
+                                        render_metrics_row([
+                                            {'label': "Año con más eventos", 'value': int(max_año['año']), 'delta': f"{int(max_año['total'])} eventos"},
+                                            {'label': "Año con menos eventos", 'value': int(min_año['año']), 'delta': f"{int(min_año['total'])} eventos"},
+                                            {'label': "Promedio anual", 'value': f"{eventos_por_año['total'].mean():.0f}", 'delta': f"±{eventos_por_año['total'].std():.0f}"},
+                                            {'label': "Años analizados", 'value': len(eventos_por_año)},
+                                        ])
                                         
                                         # Gráfico de tendencia con opciones
                                         st.markdown("##### 📈 Análisis de Tendencia Temporal")
@@ -1272,45 +2012,49 @@ if df is not None:
                                             key="trend_type"
                                         )
                                         
+                                        # Conteos por periodo directamente sobre arrays (sin copiar df_anim)
+                                        años_evento = df_anim['año'].to_numpy(dtype=np.int32)
+                                        meses_evento = df_anim['mes'].to_numpy(dtype=np.int32)
+                                        
                                         if trend_option == "Bi-anual (2 registros/año)":
-                                            # Crear semestres
-                                            df_trend = df_anim.copy()
-                                            df_trend['semestre'] = df_trend['mes'].apply(lambda x: 1 if x <= 6 else 2)
-                                            df_trend['periodo'] = df_trend.apply(
-                                                lambda x: f"S{int(x['semestre'])} {int(x['año'])}", axis=1
+                                            # Crear semestres: orden = año * 2 + semestre (1 o 2)
+                                            periodo_orden = años_evento * 2 + np.where(meses_evento <= 6, 1, 2)
+                                            counts = pd.Series(periodo_orden).value_counts(sort=False).sort_index()
+                                            orden = counts.index.to_numpy()
+                                            años_periodo = (orden - 1) // 2
+                                            semestres = orden - años_periodo * 2
+                                            periodos = np.char.add(
+                                                np.char.add('S', semestres.astype(str)),
+                                                np.char.add(' ', años_periodo.astype(str))
                                             )
-                                            df_trend['periodo_orden'] = df_trend['año'] * 2 + df_trend['semestre']
-                                            
-                                            trend_data = df_trend.groupby(['periodo', 'periodo_orden']).size().reset_index(name='eventos')
-                                            trend_data = trend_data.sort_values('periodo_orden')
                                             
                                             x_label = "Semestres"
                                         else:  # Mensual
-                                            meses_nombres = {1:'Ene', 2:'Feb', 3:'Mar', 4:'Abr', 5:'May', 6:'Jun',
-                                                           7:'Jul', 8:'Ago', 9:'Sep', 10:'Oct', 11:'Nov', 12:'Dic'}
-                                            df_trend = df_anim.copy()
-                                            df_trend['periodo'] = df_trend.apply(
-                                                lambda x: f"{meses_nombres[x['mes']]} {int(x['año'])}", axis=1
+                                            # orden = año * 12 + mes (1..12)
+                                            periodo_orden = años_evento * 12 + meses_evento
+                                            counts = pd.Series(periodo_orden).value_counts(sort=False).sort_index()
+                                            orden = counts.index.to_numpy()
+                                            años_periodo = (orden - 1) // 12
+                                            meses_periodo = orden - años_periodo * 12
+                                            periodos = np.char.add(
+                                                MES_ABBR[meses_periodo - 1],
+                                                np.char.add(' ', años_periodo.astype(str))
                                             )
-                                            df_trend['periodo_orden'] = df_trend['año'] * 12 + df_trend['mes']
-                                            
-                                            trend_data = df_trend.groupby(['periodo', 'periodo_orden']).size().reset_index(name='eventos')
-                                            trend_data = trend_data.sort_values('periodo_orden')
                                             
                                             x_label = "Meses"
                                         
                                         # Crear gráfico de tendencia mejorado
                                         fig_trend = go.Figure()
                                         
-                                        # Línea principal
-                                        fig_trend.add_trace(go.Scatter(
-                                            x=list(range(len(trend_data))),
-                                            y=trend_data['eventos'],
+                                        # Línea principal (WebGL: escala mejor con muchos periodos mensuales)
+                                        fig_trend.add_trace(go.Scattergl(
+                                            x=np.arange(len(periodos)),
+                                            y=counts.to_numpy(),
                                             mode='lines+markers',
                                             name='Eventos',
                                             line=dict(color='#64FFDA', width=3),
                                             marker=dict(size=8, color='#FF5F9E', line=dict(width=2, color='white')),
-                                            text=trend_data['periodo'],
+                                            text=periodos,
                                             hovertemplate='<b>%{text}</b><br>Eventos: %{y}<extra></extra>',
                                             fill='tozeroy',
                                             fillcolor='rgba(100, 255, 218, 0.1)'
@@ -1348,40 +2092,14 @@ if df is not None:
                                 st.divider()
                                 st.subheader("📊 Estadísticas Geográficas")
                                 
-                                col1, col2, col3, col4 = st.columns(4)
-                                
-                                with col1:
-                                    st.metric(
-                                        "Total de Eventos Georreferenciados",
-                                        f"{len(df_geo):,}",
-                                        f"{len(df_geo)/len(df)*100:.1f}% del total"
-                                    )
-                                
-                                with col2:
-                                    # Calcular centro geográfico
-                                    centro_lat = df_geo['lat'].mean()
-                                    centro_lon = df_geo['lon'].mean()
-                                    st.metric(
-                                        "Centro Geográfico",
-                                        f"{centro_lat:.4f}, {centro_lon:.4f}"
-                                    )
-                                
-                                with col3:
-                                    # Calcular área de dispersión (bounding box)
-                                    lat_range = df_geo['lat'].max() - df_geo['lat'].min()
-                                    lon_range = df_geo['lon'].max() - df_geo['lon'].min()
-                                    st.metric(
-                                        "Área de Dispersión",
-                                        f"{lat_range:.4f}° × {lon_range:.4f}°"
-                                    )
-                                
-                                with col4:
-                                    # Ubicaciones únicas
-                                    ubicaciones_unicas = df_geo[['lat', 'lon']].drop_duplicates()
-                                    st.metric(
-                                        "Ubicaciones Únicas",
-                                        f"{len(ubicaciones_unicas):,}"
-                                    )
+                                n_geo, n_total = len(df_geo), len(df)
+                                geo_stats = geo_summary(df_key, geo_key[1:], df_geo)
+                                render_metrics_row([
+                                    {'label': "Total de Eventos Georreferenciados", 'value': f"{n_geo:,}", 'delta': f"{n_geo/n_total*100:.1f}% del total"},
+                                    {'label': "Centro Geográfico", 'value': f"{geo_stats['centro_lat']:.4f}, {geo_stats['centro_lon']:.4f}"},
+                                    {'label': "Área de Dispersión", 'value': f"{geo_stats['lat_range']:.4f}° × {geo_stats['lon_range']:.4f}°"},
+                                    {'label': "Ubicaciones Únicas", 'value': f"{geo_stats['ubicaciones_unicas']:,}"},
+                                ])
                             
                             else:
                                 st.warning("⚠️ Las columnas de coordenadas están vacías. Se requiere geocodificación.")
@@ -1497,6 +2215,16 @@ if df is not None:
                                 value=True,
                                 help="Guarda coordenadas ya buscadas para no repetir"
                             )
+                            fast_comuna = st.checkbox(
+                                "Geocodificación rápida por comuna",
+                                value=False,
+                                help="Si la comuna tiene centro conocido, usarlo sin consultar Nominatim (ubicación aproximada)"
+                            )
+                            geo_debug = st.checkbox(
+                                "Mostrar información de depuración",
+                                value=False,
+                                help="Tipos, primeras filas y nulos del resultado de geocodificación"
+                            )
                         
                         # Validar que haya región antes de mostrar botón
                         if not region_manual or region_manual.strip() == "":
@@ -1512,45 +2240,27 @@ if df is not None:
                                             st.info("Continuando con coordenadas simuladas...")
                                             raise ImportError("geopy not installed")
                                         
-                                        # Inicializar geocodificador
-                                        geolocator = Nominatim(user_agent="cuidar_ia_evaluator")
+                                        # Inicializar geocodificador (sesión compartida + límite de peticiones)
+                                        geocode = build_geocoder()
                                         
-                                        # Inicializar caché si está activado
+                                        # Inicializar caché si está activado (persistida en disco entre sesiones)
                                         if use_cache and 'geocode_cache' not in st.session_state:
-                                            st.session_state.geocode_cache = {}
+                                            st.session_state.geocode_cache = load_geocode_cache()
                                         
                                         geocode_cache = st.session_state.geocode_cache if use_cache else {}
                                         
-                                        # Diccionario de coordenadas de comunas de Chile (Región de Los Ríos y alrededores)
-                                        COMUNAS_CHILE = {
-                                            # Región de Los Ríos
-                                            'valdivia': (-39.8142, -73.2459),
-                                            'la union': (-40.2934, -73.0836),
-                                            'rio bueno': (-40.3342, -72.9562),
-                                            'lago ranco': (-40.3167, -72.5000),
-                                            'futrono': (-40.1333, -72.3833),
-                                            'panguipulli': (-39.6431, -72.3328),
-                                            'lanco': (-39.4489, -72.7694),
-                                            'los lagos': (-39.8569, -72.8169),
-                                            'mariquina': (-39.5333, -72.9667),
-                                            'san jose de la mariquina': (-39.5333, -72.9667),
-                                            'corral': (-39.8889, -73.4308),
-                                            'mafil': (-39.6667, -72.9500),
-                                            'paillaco': (-40.0708, -72.8778),
-                                            # Región de Los Lagos
-                                            'osorno': (-40.5742, -73.1317),
-                                            'puerto montt': (-41.4693, -72.9424),
-                                            'puerto varas': (-41.3194, -72.9836),
-                                            'castro': (-42.4792, -73.7619),
-                                            'ancud': (-41.8706, -73.8261),
-                                            # Otras
-                                            'temuco': (-38.7359, -72.5904),
-                                            'concepcion': (-36.8270, -73.0497),
-                                            'santiago': (-33.4489, -70.6693),
-                                        }
+                                        def comuna_center_result(comuna_clean):
+                                            """Centro conocido de la comuna con una pequeña variación aleatoria"""
+                                            lat, lon = np.add(COMUNAS_CHILE[comuna_clean], geocode_rng().uniform(-0.02, 0.02, 2)).tolist()
+                                            return {
+                                                'lat': lat,
+                                                'lon': lon,
+                                                'display_name': f"{comuna_clean.title()}, Chile (centro comuna)",
+                                                'method': 'fallback'
+                                            }
                                         
                                         # Función de geocodificación FLEXIBLE con múltiples intentos
-                                        def geocode_address_flexible(address, comuna=None):
+                                        def geocode_address_flexible(address, comuna, cache_key):
                                             """
                                             Geocodifica con estrategia de fallback:
                                             1. Dirección + Comuna + Región
@@ -1558,26 +2268,13 @@ if df is not None:
                                             3. Coordenadas centrales de la Comuna (fallback)
                                             4. Coordenadas de la región (fallback final)
                                             
-                                            SIEMPRE retorna un resultado (nunca None)
+                                            SIEMPRE retorna un resultado (nunca None). Recibe el par ya
+                                            normalizado y su clave de caché, consultada antes de llamarla.
                                             """
                                             
-                                            # Revisar caché
-                                            # Manejar comuna de forma segura (puede ser None, string, o tener NaN)
-                                            comuna_str = str(comuna) if comuna is not None and not pd.isna(comuna) else "none"
-                                            cache_key = f"{address}_{comuna_str}"
-                                            if cache_key in geocode_cache:
-                                                return geocode_cache[cache_key]
-                                            
-                                            # Limpiar
-                                            address_clean = str(address).strip()
-                                            
-                                            # Manejar comuna (puede ser None, string, o Series)
-                                            if comuna is None or (isinstance(comuna, str) and not comuna.strip()):
-                                                comuna_clean = None
-                                            elif pd.isna(comuna):
-                                                comuna_clean = None
-                                            else:
-                                                comuna_clean = str(comuna).strip().lower()
+                                            # comuna llega ya normalizada (str en minúsculas, '' si falta)
+                                            comuna_clean = comuna or None
+                                            address_clean = address
                                             
                                             # Lista de queries a intentar (menos queries, más rápido)
                                             queries = []
@@ -1591,46 +2288,39 @@ if df is not None:
                                             queries.append(f"{address_clean}, Valdivia, Chile")
                                             
                                             # Intentar geocodificar (solo 1 intento por query, más rápido)
+                                            service_error = False
                                             for query in queries:
                                                 try:
-                                                    location = geolocator.geocode(query, timeout=5, exactly_one=True)
-                                                    
-                                                    if location:
-                                                        result = {
-                                                            'lat': location.latitude,
-                                                            'lon': location.longitude,
-                                                            'display_name': location.address,
-                                                            'method': 'geocoded'
-                                                        }
-                                                        geocode_cache[cache_key] = result
-                                                        return result
-                                                except:
-                                                    continue  # Continuar rápidamente al siguiente
-                                            
-                                            # FALLBACK 1: Usar coordenadas de la comuna
-                                            if comuna_clean:
-                                                # Normalizar nombre de comuna
-                                                comuna_normalized = comuna_clean.replace('san jose de la mariquina', 'mariquina')
+                                                    location = geocode(query, exactly_one=True)
+                                                except GeocoderServiceError:  # Incluye GeocoderTimedOut
+                                                    # Servicio caído o lento: no insistir con el resto de queries
+                                                    service_error = True
+                                                    break
                                                 
-                                                if comuna_normalized in COMUNAS_CHILE:
-                                                    lat, lon = COMUNAS_CHILE[comuna_normalized]
-                                                    # Agregar variación aleatoria
-                                                    lat += np.random.uniform(-0.02, 0.02)
-                                                    lon += np.random.uniform(-0.02, 0.02)
-                                                    
+                                                if location:
                                                     result = {
-                                                        'lat': lat,
-                                                        'lon': lon,
-                                                        'display_name': f"{comuna_clean.title()}, Chile (centro comuna)",
-                                                        'method': 'fallback'
+                                                        'lat': location.latitude,
+                                                        'lon': location.longitude,
+                                                        'display_name': location.address,
+                                                        'method': 'geocoded'
                                                     }
                                                     geocode_cache[cache_key] = result
                                                     return result
                                             
+                                            # Sin resultados reales: la aproximación se cachea (resultado negativo) y las
+                                            # siguientes ejecuciones no vuelven a consultar. Tras un error de servicio no se
+                                            # cachea, para reintentar la búsqueda exacta más adelante.
+                                            cacheable = not service_error
+                                            
+                                            # FALLBACK 1: Usar coordenadas de la comuna
+                                            if comuna_clean in COMUNAS_CHILE:
+                                                result = comuna_center_result(comuna_clean)
+                                                if cacheable:
+                                                    geocode_cache[cache_key] = result
+                                                return result
+                                            
                                             # FALLBACK 2: Coordenadas del centro de Valdivia (SIEMPRE)
-                                            lat, lon = (-39.8142, -73.2459)  # Centro de Valdivia
-                                            lat += np.random.uniform(-0.05, 0.05)
-                                            lon += np.random.uniform(-0.05, 0.05)
+                                            lat, lon = np.add((-39.8142, -73.2459), geocode_rng().uniform(-0.05, 0.05, 2)).tolist()  # Centro de Valdivia
                                             
                                             result = {
                                                 'lat': lat,
@@ -1638,130 +2328,122 @@ if df is not None:
                                                 'display_name': f"Valdivia, Chile (región)",
                                                 'method': 'fallback'
                                             }
-                                            geocode_cache[cache_key] = result
+                                            if cacheable:
+                                                geocode_cache[cache_key] = result
                                             return result
                                         
                                         # Preparar datos
+                                        # CRÍTICO: Asegurar que los nombres de columna son strings
+                                        addr_col = str(selected_address_col)
+                                        
+                                        # Posiciones de las filas a geocodificar (para recuperar la fecha sin merge por texto)
+                                        filas = np.flatnonzero(df[addr_col].notna().to_numpy())[:max_addresses]
+                                        if not selected_comuna_col:
+                                            # Sin columna de comuna: direcciones únicas (primera aparición, antes de pasar a texto)
+                                            filas = filas[~df[addr_col].iloc[filas].duplicated().to_numpy()]
+                                        direcciones = df[addr_col].iloc[filas].astype(str)
+                                        
                                         if selected_comuna_col:
-                                            # CRÍTICO: Asegurar que selected_address_col y selected_comuna_col son strings
-                                            addr_col = str(selected_address_col)
-                                            comuna_col = str(selected_comuna_col)
-                                            
-                                            # Crear subset del DataFrame
-                                            geocode_df = df[[addr_col, comuna_col]].copy()
-                                            
-                                            # Dropna de forma segura
-                                            geocode_df = geocode_df[geocode_df[addr_col].notna()].head(max_addresses)
-                                            
-                                            # Resetear índice para evitar problemas
-                                            geocode_df = geocode_df.reset_index(drop=True)
-                                            
-                                            # SOLUCIÓN ULTRA-ROBUSTA: Convertir a arrays de NumPy PRIMERO
-                                            # Esto garantiza valores primitivos de Python
-                                            addr_array = geocode_df[addr_col].values  # NumPy array
-                                            comuna_array = geocode_df[comuna_col].values  # NumPy array
-                                            
-                                            # Ahora iterar sobre arrays simples
-                                            sample_to_geocode = []
-                                            for i in range(len(addr_array)):
-                                                addr_val = addr_array[i]
-                                                comuna_val = comuna_array[i]
-                                                
-                                                # Verificar None/NaN de forma segura
-                                                # Usar 'is None' o comparación con np.nan
-                                                if addr_val is None or (isinstance(addr_val, float) and np.isnan(addr_val)):
-                                                    addr_str = ''
-                                                else:
-                                                    addr_str = str(addr_val)
-                                                
-                                                if comuna_val is None or (isinstance(comuna_val, float) and np.isnan(comuna_val)):
-                                                    comuna_str = None
-                                                else:
-                                                    comuna_str = str(comuna_val)
-                                                
-                                                sample_to_geocode.append({
-                                                    'direccion': addr_str,
-                                                    'comuna': comuna_str
-                                                })
+                                            # Normalizar la comuna una sola vez para toda la columna
+                                            comunas = df[str(selected_comuna_col)].iloc[filas].fillna('').astype(str).str.strip()
+                                            comunas_label = comunas.mask(comunas == '', 'N/A').tolist()
                                         else:
-                                            # Sin columna de comuna
-                                            # Obtener direcciones únicas como lista Python
-                                            addresses_list = addresses_sample.head(max_addresses).dropna().unique().tolist()
-                                            
-                                            sample_to_geocode = []
-                                            for addr in addresses_list:
-                                                if addr is None or (isinstance(addr, float) and np.isnan(addr)):
-                                                    addr_str = ''
-                                                else:
-                                                    addr_str = str(addr)
-                                                
-                                                sample_to_geocode.append({
-                                                    'direccion': addr_str,
-                                                    'comuna': None
-                                                })
+                                            comunas = pd.Series('', index=direcciones.index)
+                                            comunas_label = ['N/A'] * len(direcciones)
+                                        
+                                        # Clave normalizada (dirección|comuna): cada par distinto se geocodifica una sola vez
+                                        direcciones_norm = direcciones.str.strip().str.replace(r'\s+', ' ', regex=True)
+                                        comunas_norm = normalize_comunas(comunas)
+                                        par_codes, _ = pd.factorize(direcciones_norm.str.lower() + '|' + comunas_norm)
+                                        primeros = np.unique(par_codes, return_index=True)[1]
+                                        pares_unicos = list(zip(direcciones_norm.to_numpy()[primeros], comunas_norm.to_numpy()[primeros]))
                                         
-                                        st.info(f"🔍 Geocodificando {len(sample_to_geocode)} registros...")
+                                        # Comunas con centro conocido: su aproximación no necesita red
+                                        n_comuna_conocida = int(comunas_norm.iloc[primeros].isin(COMUNAS_CHILE.keys()).sum())
+                                        if n_comuna_conocida:
+                                            st.caption(f"📌 {n_comuna_conocida} de {len(pares_unicos)} direcciones únicas tienen comuna con centro conocido")
+                                        
+                                        st.info(f"🔍 Geocodificando {len(direcciones)} registros ({len(pares_unicos)} direcciones únicas)...")
                                         
                                         # Geocodificar direcciones con barra de progreso
-                                        geocoded_results = []
                                         progress_bar = st.progress(0)
                                         status_text = st.empty()
                                         
-                                        successful = 0
-                                        fallback_count = 0
-                                        
-                                        for idx, record in enumerate(sample_to_geocode):
-                                            # Actualizar progreso
-                                            progress = (idx + 1) / len(sample_to_geocode)
-                                            progress_bar.progress(progress)
-                                            status_text.text(f"Geocodificando {idx + 1}/{len(sample_to_geocode)} - ✅ Exactas: {successful} | ⚠️ Aproximadas: {fallback_count}")
-                                            
-                                            address = record['direccion']
-                                            comuna = record.get('comuna')
-                                            
-                                            # SIEMPRE retorna resultado
-                                            result = geocode_address_flexible(address, comuna)
-                                            
-                                            geocoded_results.append({
-                                                'direccion': address,
-                                                'comuna': str(comuna) if comuna is not None and not pd.isna(comuna) else 'N/A',
-                                                'lat': result['lat'],
-                                                'lon': result['lon'],
-                                                'direccion_completa': result['display_name'],
-                                                'metodo': result.get('method', 'unknown')
-                                            })
-                                            
-                                            if result.get('method') == 'fallback':
-                                                fallback_count += 1
+                                        # Aciertos de caché resueltos en el hilo principal: solo los pendientes van al pool
+                                        resultados = [None] * len(pares_unicos)
+                                        pendientes = []
+                                        cache_keys = [geocode_cache_key(address, comuna or "none") for address, comuna in pares_unicos]
+                                        for code, cache_key in enumerate(cache_keys):
+                                            cached = geocode_cache.get(cache_key)
+                                            if cached is not None:
+                                                if 'display_name' not in cached:
+                                                    # Entrada leída de disco (sin dirección guardada): se muestra la buscada
+                                                    cached = {**cached, 'display_name': f"{pares_unicos[code][0]} (en caché)"}
+                                                resultados[code] = cached
                                             else:
-                                                successful += 1
+                                                pendientes.append(code)
+                                        
+                                        # Geocodificación rápida: comunas conocidas resueltas en bloque, sin Nominatim
+                                        # (no se guardan en caché para no tapar una búsqueda exacta posterior)
+                                        rapidas = [code for code in pendientes if pares_unicos[code][1] in COMUNAS_CHILE] if fast_comuna else []
+                                        if rapidas:
+                                            centros = np.array([COMUNAS_CHILE[pares_unicos[code][1]] for code in rapidas])
+                                            coords = centros + geocode_rng().uniform(-0.02, 0.02, centros.shape)  # Variación aleatoria en un solo sorteo
+                                            for code, (lat, lon) in zip(rapidas, coords.tolist()):
+                                                resultados[code] = {
+                                                    'lat': lat,
+                                                    'lon': lon,
+                                                    'display_name': f"{pares_unicos[code][1].title()}, Chile (centro comuna)",
+                                                    'method': 'fallback'
+                                                }
+                                            pendientes = [code for code in pendientes if resultados[code] is None]
+                                        
+                                        # Peticiones concurrentes; el progreso se actualiza desde el hilo principal
+                                        with ThreadPoolExecutor(max_workers=GEOCODE_WORKERS) as executor:
+                                            futures = {
+                                                executor.submit(geocode_address_flexible, *pares_unicos[code], cache_keys[code]): code
+                                                for code in pendientes
+                                            }
                                             
-                                            # Pausa corta
-                                            time.sleep(0.5)
+                                            # Procesar en orden de llegada (SIEMPRE retorna resultado)
+                                            last_update = 0.0
+                                            for idx, future in enumerate(as_completed(futures), start=1):
+                                                resultados[futures[future]] = future.result()
+                                                
+                                                # Actualizar progreso como máximo 5 veces por segundo
+                                                now = time.monotonic()
+                                                if now - last_update > 0.2 or idx == len(pendientes):
+                                                    progress_bar.progress(idx / len(pendientes))
+                                                    status_text.text(f"Geocodificando {idx}/{len(pendientes)} direcciones sin caché")
+                                                    last_update = now
                                         
                                         progress_bar.empty()
                                         status_text.empty()
                                         
-                                        # Crear DataFrame con resultados
-                                        if geocoded_results:
-                                            geo_df = pd.DataFrame(geocoded_results)
+                                        if use_cache:
+                                            persist_geocode_cache(geocode_cache)
+                                        
+                                        # Crear DataFrame con resultados: columnas de los pares únicos expandidas por código
+                                        if len(par_codes):
+                                            metodos = np.array([r.get('method', 'unknown') for r in resultados], dtype=object)[par_codes]
+                                            geo_df = pd.DataFrame({
+                                                'direccion': direcciones.to_numpy(),
+                                                'comuna': comunas_label,
+                                                # float32 basta para coordenadas y reduce el JSON que plotly envía al navegador
+                                                'lat': np.array([r['lat'] for r in resultados], dtype=np.float32)[par_codes],
+                                                'lon': np.array([r['lon'] for r in resultados], dtype=np.float32)[par_codes],
+                                                'direccion_completa': np.array([r['display_name'] for r in resultados], dtype=object)[par_codes],
+                                                'metodo': metodos
+                                            })
+                                            fallback_count = int((metodos == 'fallback').sum())
+                                            successful = len(metodos) - fallback_count
                                             
                                             # Agregar columna temporal si existe
                                             if datetime_cols:
                                                 date_col = str(datetime_cols[0])  # ✅ Asegurar string
-                                                addr_col = str(selected_address_col)  # ✅ Asegurar string
-                                                
-                                                # Hacer merge con las direcciones originales - DE FORMA SEGURA
-                                                temp_df = df[[addr_col, date_col]].copy()
-                                                temp_df = temp_df.rename(columns={addr_col: 'direccion', date_col: 'fecha'})
                                                 
-                                                # Convertir direcciones a string en ambos DataFrames antes del merge
-                                                geo_df['direccion'] = geo_df['direccion'].astype(str)
-                                                temp_df['direccion'] = temp_df['direccion'].astype(str)
-                                                temp_df['fecha'] = temp_df['fecha'].astype(str)
-                                                
-                                                # Merge seguro
-                                                geo_df = geo_df.merge(temp_df, on='direccion', how='left')
+                                                # Fecha de cada fila original por posición (sin duplicar filas por dirección repetida)
+                                                geo_df['fecha'] = df[date_col].iloc[filas].astype(str).to_numpy()
                                             
                                             # Mostrar resultados de geocodificación
                                             total = successful + fallback_count
@@ -1786,13 +2468,12 @@ if df is not None:
                                             
                                             # Mostrar distribución de métodos
                                             with st.expander("📊 Detalle de Métodos de Geocodificación"):
-                                                method_counts = geo_df['metodo'].value_counts()
                                                 st.write("**Distribución:**")
-                                                st.write(f"- Geocodificadas: {method_counts.get('geocoded', 0)}")
-                                                st.write(f"- Aproximadas (fallback): {method_counts.get('fallback', 0)}")
+                                                st.write(f"- Geocodificadas: {successful}")
+                                                st.write(f"- Aproximadas (fallback): {fallback_count}")
                                                 
                                                 # Mostrar muestra de direcciones aproximadas
-                                                fallback_sample = geo_df[geo_df['metodo'] == 'fallback'].head(10)
+                                                fallback_sample = geo_df[metodos == 'fallback'].head(10)
                                                 if len(fallback_sample) > 0:
                                                     st.write("**Muestra de direcciones aproximadas:**")
                                                     st.dataframe(fallback_sample[['direccion', 'comuna', 'direccion_completa']])
@@ -1801,29 +2482,26 @@ if df is not None:
                                             st.subheader("🗺️ Mapa Interactivo de Eventos")
                                             st.write(f"**Visualizando {len(geo_df)} eventos con coordenadas reales en {region_manual}**")
                                             
-                                            # DEBUGGING: Mostrar info del DataFrame
-                                            with st.expander("🔍 Debug: Información del DataFrame", expanded=False):
-                                                st.write("**Columnas:**", geo_df.columns.tolist())
-                                                st.write("**Tipos de datos:**")
-                                                st.write(geo_df.dtypes)
-                                                st.write("**Primeras 3 filas:**")
-                                                st.write(geo_df.head(3))
-                                                st.write("**Valores nulos por columna:**")
-                                                st.write(geo_df.isnull().sum())
+                                            # DEBUGGING: Mostrar info del DataFrame (solo si se pidió, evita recorrer geo_df)
+                                            if geo_debug:
+                                                with st.expander("🔍 Debug: Información del DataFrame", expanded=False):
+                                                    st.write("**Columnas:**", geo_df.columns.tolist())
+                                                    st.write("**Tipos de datos:**")
+                                                    st.write(geo_df.dtypes)
+                                                    st.write("**Primeras 3 filas:**")
+                                                    st.write(geo_df.head(3))
+                                                    st.write("**Valores nulos por columna:**")
+                                                    st.write(geo_df.isnull().sum())
                                             
                                             # IMPORTANTE: Asegurar que todas las columnas sean strings simples para plotly
                                             # Esto evita el error "not enough values to unpack"
-                                            for col in ['direccion', 'comuna', 'direccion_completa', 'metodo']:
-                                                if col in geo_df.columns:
-                                                    geo_df[col] = geo_df[col].astype(str)
-                                            
-                                            # CRÍTICO: Limpiar NaN y None en todas las columnas
-                                            geo_df = geo_df.fillna('N/A')
+                                            # (NaN y None se limpian en la misma pasada)
+                                            str_cols = geo_df.columns.intersection(['direccion', 'comuna', 'direccion_completa', 'metodo', 'fecha'])
+                                            geo_df[str_cols] = geo_df[str_cols].fillna('N/A').astype(str)
                                             
-                                            # VALIDACIÓN EXTRA: Asegurar que lat/lon son numéricos limpios
-                                            geo_df['lat'] = pd.to_numeric(geo_df['lat'], errors='coerce')
-                                            geo_df['lon'] = pd.to_numeric(geo_df['lon'], errors='coerce')
-                                            geo_df = geo_df.dropna(subset=['lat', 'lon'])
+                                            # lat/lon ya son float32 por construcción (Nominatim o fallback siempre dan números)
+                                            if geo_debug:
+                                                assert np.isfinite(geo_df[['lat', 'lon']].to_numpy()).all(), "Coordenadas no finitas"
                                             
                                             if len(geo_df) == 0:
                                                 st.error("❌ No hay coordenadas válidas después de limpieza")
@@ -1858,9 +2536,11 @@ if df is not None:
                                                     # Intentar versión aún más simple con scatter
                                                     st.warning("⚠️ Intentando mapa de puntos simple...")
                                                     try:
+                                                        lat_arr = geo_df['lat'].to_numpy()
+                                                        lon_arr = geo_df['lon'].to_numpy()
                                                         fig_simple = go.Figure(go.Scattermapbox(
-                                                            lat=geo_df['lat'],
-                                                            lon=geo_df['lon'],
+                                                            lat=lat_arr,
+                                                            lon=lon_arr,
                                                             mode='markers',
                                                             marker=dict(size=8, color='red')
                                                         ))
@@ -1870,8 +2550,8 @@ if df is not None:
                                                                 style="open-street-map",
                                                                 zoom=11,
                                                                 center=dict(
-                                                                    lat=geo_df['lat'].mean(),
-                                                                    lon=geo_df['lon'].mean()
+                                                                    lat=float(lat_arr.mean()),
+                                                                    lon=float(lon_arr.mean())
                                                                 )
                                                             ),
                                                             height=600,
@@ -1892,17 +2572,23 @@ if df is not None:
                                                 try:
                                                     st.info("🔄 Generando mapa de puntos...")
                                                     
-                                                    # VERSIÓN SIMPLE SIN HOVER
-                                                    fig_scatter = px.scatter_mapbox(
-                                                        geo_df,
-                                                        lat='lat',
-                                                        lon='lon',
-                                                        # SIN hover_name ni hover_data
-                                                        zoom=11,
-                                                        mapbox_style="open-street-map",
+                                                    # VERSIÓN SIMPLE SIN HOVER (traza construida directamente, sin plotly express)
+                                                    lat_arr = geo_df['lat'].to_numpy()
+                                                    lon_arr = geo_df['lon'].to_numpy()
+                                                    fig_scatter = go.Figure(go.Scattermapbox(
+                                                        lat=lat_arr,
+                                                        lon=lon_arr,
+                                                        mode='markers',
+                                                        marker=dict(color='#FF5F9E')
+                                                    ))
+                                                    fig_scatter.update_layout(
+                                                        mapbox=dict(
+                                                            style="open-street-map",
+                                                            zoom=11,
+                                                            center=dict(lat=float(lat_arr.mean()), lon=float(lon_arr.mean()))
+                                                        ),
                                                         title="Ubicación Exacta de Cada Evento",
-                                                        height=500,
-                                                        color_discrete_sequence=['#FF5F9E']
+                                                        height=500
                                                     )
                                                     
                                                     st.plotly_chart(fig_scatter, use_container_width=True)
@@ -1982,17 +2668,16 @@ if df is not None:
                                         geo_df = pd.DataFrame({
                                             'lat': lats,
                                             'lon': lons,
-                                            'direccion': addresses_sample.head(n_eventos).astype(str).values
+                                            'direccion': addresses_sample.head(n_eventos).astype(str).to_numpy()
                                         })
                                         
                                         if datetime_cols:
-                                            date_col = datetime_cols[0]
-                                            geo_df['fecha'] = df[date_col].head(n_eventos).astype(str).values
+                                            date_col = str(datetime_cols[0])
+                                            geo_df['fecha'] = date_strings(df_key, date_col, n_eventos, df)
                                         
-                                        # Asegurar que todas las columnas sean strings para plotly
-                                        for col in geo_df.columns:
-                                            if col not in ['lat', 'lon']:  # Mantener lat/lon como numéricos
-                                                geo_df[col] = geo_df[col].astype(str)
+                                        # Asegurar que todas las columnas sean strings para plotly (lat/lon siguen numéricos)
+                                        str_cols = geo_df.columns.difference(['lat', 'lon'])
+                                        geo_df[str_cols] = geo_df[str_cols].astype(str)
                                         
                                         fig_map = px.density_mapbox(
                                             geo_df,
@@ -2028,31 +2713,23 @@ if df is not None:
                 )
                 
                 if selected_date_col:
-                    df_temporal = df[[selected_date_col]].copy()
-                    df_temporal = df_temporal.dropna()
-                    df_temporal['fecha'] = pd.to_datetime(df_temporal[selected_date_col], errors='coerce')
-                    df_temporal = df_temporal.dropna()
+                    # Fechas válidas y sus componentes, cacheados por dataset y columna
+                    df_temporal = temporal_frame(df_key, str(selected_date_col), df)
                     
                     if len(df_temporal) > 0:
-                        # Extraer componentes temporales
-                        df_temporal['año'] = df_temporal['fecha'].dt.year
-                        df_temporal['mes'] = df_temporal['fecha'].dt.month
-                        df_temporal['día'] = df_temporal['fecha'].dt.day
-                        df_temporal['día_semana'] = df_temporal['fecha'].dt.dayofweek
-                        df_temporal['semana_año'] = df_temporal['fecha'].dt.isocalendar().week
-                        
-                        # Métricas temporales
+                        # Métricas temporales: extremos sobre el ndarray datetime64 (sin Timestamps)
+                        fechas_np = df_temporal['fecha'].to_numpy('datetime64[ns]')
+                        fecha_min = fechas_np.min()
+                        fecha_max = fechas_np.max()
                         col1, col2, col3, col4 = st.columns(4)
                         with col1:
                             st.metric("Eventos Totales", len(df_temporal))
                         with col2:
-                            fecha_min = df_temporal['fecha'].min()
-                            st.metric("Primer Evento", fecha_min.strftime('%Y-%m-%d'))
+                            st.metric("Primer Evento", np.datetime_as_string(fecha_min, unit='D'))
                         with col3:
-                            fecha_max = df_temporal['fecha'].max()
-                            st.metric("Último Evento", fecha_max.strftime('%Y-%m-%d'))
+                            st.metric("Último Evento", np.datetime_as_string(fecha_max, unit='D'))
                         with col4:
-                            dias_span = (fecha_max - fecha_min).days
+                            dias_span = int((fecha_max - fecha_min) // np.timedelta64(1, 'D'))
                             st.metric("Período (días)", dias_span)
                         
                         # Serie temporal
@@ -2070,97 +2747,40 @@ if df is not None:
                         with col_agg2:
                             mostrar_tendencia = st.checkbox("Mostrar tendencia", value=True, key="mostrar_tendencia")
                         
-                        # Preparar datos según agregación
-                        df_temporal_agg = df_temporal.copy()
-                        df_temporal_agg['año_mes'] = df_temporal_agg['fecha'].dt.to_period('M')
-                        
+                        # Preparar datos según agregación: todos los niveles se derivan de la
+                        # clave cacheada mes_abs (meses desde 1970) con división entera
                         if agregacion == "Mensual":
-                            eventos_agg = df_temporal_agg.groupby('año_mes').size().reset_index()
-                            eventos_agg.columns = ['Período', 'Eventos']
-                            eventos_agg['Período'] = eventos_agg['Período'].dt.to_timestamp()
+                            meses_por_periodo = 1
                             titulo = 'Eventos Mensuales'
                             
                         elif agregacion == "Trimestral":
-                            df_temporal_agg['trimestre'] = df_temporal_agg['fecha'].dt.to_period('Q')
-                            eventos_agg = df_temporal_agg.groupby('trimestre').size().reset_index()
-                            eventos_agg.columns = ['Período', 'Eventos']
-                            eventos_agg['Período'] = eventos_agg['Período'].dt.to_timestamp()
+                            meses_por_periodo = 3
                             titulo = 'Eventos Trimestrales'
                             
                         elif agregacion == "Anual":
-                            eventos_agg = df_temporal_agg.groupby('año').size().reset_index()
-                            eventos_agg.columns = ['Período', 'Eventos']
-                            eventos_agg['Período'] = pd.to_datetime(eventos_agg['Período'], format='%Y')
+                            meses_por_periodo = 12
                             titulo = 'Eventos Anuales'
                             
-                        else:  # Quinquenal
-                            df_temporal_agg['quinquenio'] = (df_temporal_agg['año'] // 5) * 5
-                            eventos_agg = df_temporal_agg.groupby('quinquenio').size().reset_index()
-                            eventos_agg.columns = ['Período', 'Eventos']
-                            eventos_agg['Período'] = pd.to_datetime(eventos_agg['Período'], format='%Y')
+                        else:  # Quinquenal (1970 es múltiplo de 5: los bins coinciden con año // 5)
+                            meses_por_periodo = 60
                             titulo = 'Eventos Quinquenales (cada 5 años)'
                         
-                        # Crear gráfico epidemiológico profesional
-                        fig_temporal = go.Figure()
-                        
-                        # Línea principal
-                        fig_temporal.add_trace(go.Scatter(
-                            x=eventos_agg['Período'],
-                            y=eventos_agg['Eventos'],
-                            mode='lines+markers',
-                            name='Eventos',
-                            line=dict(color='#2E86AB', width=2),
-                            marker=dict(size=6, color='#2E86AB'),
-                            hovertemplate='<b>%{x|%Y-%m}</b><br>Eventos: %{y}<extra></extra>'
-                        ))
-                        
-                        # Línea de tendencia (suavizado)
-                        if mostrar_tendencia and len(eventos_agg) > 3:
-                            from scipy.ndimage import uniform_filter1d
-                            window = min(12 if agregacion == "Mensual" else 4, len(eventos_agg) // 3)
-                            if window >= 2:
-                                tendencia = uniform_filter1d(eventos_agg['Eventos'].values, size=window)
-                                fig_temporal.add_trace(go.Scatter(
-                                    x=eventos_agg['Período'],
-                                    y=tendencia,
-                                    mode='lines',
-                                    name='Tendencia',
-                                    line=dict(color='#A23B72', width=3, dash='dash'),
-                                    hovertemplate='<b>Tendencia</b><br>%{y:.1f}<extra></extra>'
-                                ))
-                        
-                        # Media histórica
-                        media = eventos_agg['Eventos'].mean()
-                        fig_temporal.add_hline(
-                            y=media,
-                            line_dash="dot",
-                            line_color="gray",
-                            annotation_text=f"Media: {media:.1f}",
-                            annotation_position="right"
+                        # bincount desde el primer periodo: los periodos sin eventos quedan en 0
+                        clave = df_temporal['mes_abs'].to_numpy() // meses_por_periodo
+                        base = clave.min()
+                        conteos = np.bincount(clave - base)
+                        periodos = (
+                            (np.arange(base, base + len(conteos)) * meses_por_periodo)
+                            .astype('datetime64[M]').astype('datetime64[ns]')
                         )
+                        # int32 basta para conteos y reduce a la mitad el payload de Plotly
+                        eventos_agg = pd.DataFrame({'Período': periodos, 'Eventos': conteos.astype(np.int32)})
                         
-                        # Configuración del layout
-                        fig_temporal.update_layout(
-                            title={
-                                'text': f'<b>{titulo}</b>',
-                                'x': 0.5,
-                                'xanchor': 'center',
-                                'font': {'size': 18}
-                            },
-                            xaxis_title='Período',
-                            yaxis_title='Número de Eventos',
-                            hovermode='x unified',
-                            height=450,
-                            template='plotly_white',
-                            showlegend=True,
-                            legend=dict(
-                                orientation="h",
-                                yanchor="bottom",
-                                y=1.02,
-                                xanchor="right",
-                                x=1
-                            )
-                        )
+                        fig_temporal = go.Figure(build_temporal_figure(
+                            df_key, str(selected_date_col), agregacion, mostrar_tendencia, titulo, eventos_agg
+                        ))
+                        # Las cuatro estadísticas de la serie en una sola llamada
+                        media, std, max_eventos, min_eventos = eventos_agg['Eventos'].agg(['mean', 'std', 'max', 'min'])
                         
                         st.plotly_chart(fig_temporal, use_container_width=True)
                         
@@ -2169,13 +2789,10 @@ if df is not None:
                         with col_stat1:
                             st.metric("Media", f"{media:.1f}", help="Promedio de eventos por período")
                         with col_stat2:
-                            std = eventos_agg['Eventos'].std()
                             st.metric("Desv. Est.", f"{std:.1f}", help="Variabilidad de eventos")
                         with col_stat3:
-                            max_eventos = eventos_agg['Eventos'].max()
                             st.metric("Máximo", f"{int(max_eventos)}", help="Mayor número de eventos en un período")
                         with col_stat4:
-                            min_eventos = eventos_agg['Eventos'].min()
                             st.metric("Mínimo", f"{int(min_eventos)}", help="Menor número de eventos en un período")
                         
                         # Patrones temporales
@@ -2185,11 +2802,10 @@ if df is not None:
                         
                         with col_p1:
                             # Eventos por mes
-                            eventos_mes = df_temporal.groupby('mes').size().reset_index()
-                            eventos_mes.columns = ['Mes', 'Eventos']
-                            meses_nombres = {1:'Ene', 2:'Feb', 3:'Mar', 4:'Abr', 5:'May', 6:'Jun',
-                                           7:'Jul', 8:'Ago', 9:'Sep', 10:'Oct', 11:'Nov', 12:'Dic'}
-                            eventos_mes['Mes_nombre'] = eventos_mes['Mes'].map(meses_nombres)
+                            # Dominio fijo 1..12: un bincount basta (sin hashing ni agrupador)
+                            counts_mes = np.bincount(df_temporal['mes'].to_numpy(), minlength=13)[1:].astype(np.int32)
+                            eventos_mes = pd.DataFrame({'Mes': np.arange(1, 13), 'Eventos': counts_mes})
+                            eventos_mes['Mes_nombre'] = MES_ABBR[eventos_mes['Mes'].to_numpy() - 1]
                             
                             fig_mes = px.bar(
                                 eventos_mes,
@@ -2201,10 +2817,9 @@ if df is not None:
                         
                         with col_p2:
                             # Eventos por día de la semana
-                            eventos_dia = df_temporal.groupby('día_semana').size().reset_index()
-                            eventos_dia.columns = ['Día', 'Eventos']
-                            dias_nombres = {0:'Lun', 1:'Mar', 2:'Mié', 3:'Jue', 4:'Vie', 5:'Sáb', 6:'Dom'}
-                            eventos_dia['Día_nombre'] = eventos_dia['Día'].map(dias_nombres)
+                            counts_dia = np.bincount(df_temporal['día_semana'].to_numpy(), minlength=7).astype(np.int32)
+                            eventos_dia = pd.DataFrame({'Día': np.arange(7), 'Eventos': counts_dia})
+                            eventos_dia['Día_nombre'] = DIA_ABBR[eventos_dia['Día'].to_numpy()]
                             
                             fig_dia = px.bar(
                                 eventos_dia,
@@ -2267,8 +2882,9 @@ if df is not None:
                     diagnosis = generate_diagnosis(results, df)
                     
                     if diagnosis:
+                        # Se muestra en el expander de abajo, asociado a la huella del dataset
                         st.session_state.diagnosis_text = diagnosis
-                        st.markdown(diagnosis)
+                        st.session_state.diagnosis_key = df_key
                     else:
                         st.warning("No se pudo generar el diagnóstico. Verifica tu configuración de OpenAI.")
                 
@@ -2276,8 +2892,12 @@ if df is not None:
                     st.error(f"Error al generar diagnóstico: {str(e)}")
                     st.info("Asegúrate de tener configurada tu API key de OpenAI en el archivo .env")
         
-        # Mostrar diagnóstico previo si existe
-        if 'diagnosis_text' in st.session_state and st.session_state.diagnosis_text:
+        # Mostrar diagnóstico previo solo si corresponde al dataset actual
+        diagnosis_vigente = (
+            bool(st.session_state.get('diagnosis_text'))
+            and st.session_state.get('diagnosis_key') == df_key
+        )
+        if diagnosis_vigente:
             with st.expander("📝 Diagnóstico Generado", expanded=True):
                 st.markdown(st.session_state.diagnosis_text)
         
@@ -2290,10 +2910,11 @@ if df is not None:
         with col1:
             # Descargar JSON consolidado
             try:
-                json_str = json.dumps(convert_numpy_types(results), indent=2, ensure_ascii=False)
+                # Serializado una vez por dataset: los reruns reutilizan los mismos bytes
+                json_bytes = results_json_bytes(df_key, results)
                 st.download_button(
                     label="📥 Descargar Análisis Completo (JSON)",
-                    data=json_str,
+                    data=json_bytes,
                     file_name=f"analisis_completo_{uploaded_file.name}_{datetime.now().strftime('%Y%m%d')}.json",
                     mime="application/json"
                 )
@@ -2302,7 +2923,7 @@ if df is not None:
         
         with col2:
             # Descargar diagnóstico en texto
-            if 'diagnosis_text' in st.session_state and st.session_state.diagnosis_text:
+            if diagnosis_vigente:
                 st.download_button(
                     label="📥 Descargar Diagnóstico",
                     data=st.session_state.diagnosis_text,
@@ -2314,8 +2935,8 @@ if df is not None:
             # Descargar PDF
             if st.button("📄 Generar Reporte PDF", type="primary"):
                 try:
-                    pdf = generate_data_quality_pdf(results)
-                    pdf_bytes = pdf.output(dest='S').encode('latin-1')
+                    # Cacheado por huella del dataset: clics posteriores no regeneran el PDF
+                    pdf_bytes = quality_pdf_bytes(df_key, results)
                     
                     st.download_button(
                         label="⬇️ Descargar PDF",
@@ -109,3 +109,26 @@ def render_metric(label, value, delta=None, color="primary"):
         {delta_html}
     </div>
     """, unsafe_allow_html=True)
+
+def render_metrics_row(items):
+    """
+    Renders a row of metrics as a single HTML grid (one Streamlit element).
+    
+    Args:
+        items (list[dict]): Metrics with 'label', 'value' and an optional 'delta' text.
+    """
+    cells = []
+    for item in items:
+        delta = item.get('delta')
+        delta_html = f'<div style="color: var(--text-muted); font-size: 0.8rem; margin-top: 0.2rem;">{delta}</div>' if delta else ""
+        cells.append(
+            f'<div class="metric-container">'
+            f'<div class="metric-label">{item["label"]}</div>'
+            f'<div class="metric-value">{item["value"]}</div>'
+            f'{delta_html}</div>'
+        )
+    
+    st.markdown(
+        f'<div style="display: grid; grid-template-columns: repeat({len(items)}, 1fr); gap: 1rem;">{"".join(cells)}</div>',
+        unsafe_allow_html=True
+    )
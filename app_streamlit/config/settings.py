@@ -25,6 +25,7 @@ class Settings(BaseSettings):
     DATA_DIR: str = "data"
     UPLOAD_DIR: Path = BASE_DIR / "data" / "uploads"
     ANONYMIZED_DIR: Path = BASE_DIR / "data" / "anonymized"
+    GEOCODE_CACHE_FILE: Path = BASE_DIR / "data" / "cache" / "geocode_cache.json"
     OUTPUTS_DIR: str = "data/outputs"
     VECTORSTORE_DIR: str = "data/vectorstore"
     